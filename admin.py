@@ -1,14 +1,38 @@
-import firebase_admin
-from firebase_admin import firestore
-from firebase_admin import credentials
-from firebase_admin import auth
-
-cred = credentials.Certificate(
-    "thelettersproject-firebase-adminsdk-jgkj4-b577df0515.json")
-firebase_admin.initialize_app(
-    cred, {'databaseURL': 'https://thelettersproject.firebaseio.com', 'authDomain': 'thelettersproject-artrater.web.app'})
-
-db = firestore.client()
-experiment_ref = db.collection(u'experiments')
-experiment_type_ref = db.collection(u'experiment_types')
-firestore = firestore
\ No newline at end of file
+import threading
+
+# firebase_admin pulls in gRPC and the Firestore client, which is slow to
+# import. Nothing here happens until the first call to get_db().
+_db = None
+_lock = threading.Lock()
+
+
+def get_db():
+    global _db
+    if (_db is None):
+        with _lock:
+            if (_db is None):
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+                cred = credentials.Certificate(
+                    "thelettersproject-firebase-adminsdk-jgkj4-b577df0515.json")
+                firebase_admin.initialize_app(
+                    cred, {'databaseURL': 'https://thelettersproject.firebaseio.com', 'authDomain': 'thelettersproject-artrater.web.app'})
+                _db = firestore.client()
+    return _db
+
+
+def __getattr__(name):
+    # Keeps `from admin import db, experiment_ref, ...` working, lazily
+    if (name == 'db'):
+        return get_db()
+    if (name == 'experiment_ref'):
+        return get_db().collection(u'experiments')
+    if (name == 'experiment_type_ref'):
+        return get_db().collection(u'experiment_types')
+    if (name == 'firestore'):
+        from firebase_admin import firestore
+        return firestore
+    if (name == 'auth'):
+        from firebase_admin import auth
+        return auth
+    raise AttributeError(name)
@@ -0,0 +1,157 @@
+import datetime
+import threading
+
+from firebase_admin import firestore
+
+from storage import TRIALS_PER_EXPERIMENT, LEASE_SECONDS, new_lease
+from metrics import count_firestore
+
+
+class TrialSliceAllocator:
+    """
+    Hands out consecutive [start, end) slices of the trial design.
+
+    The next free index lives in a single counter document that is read and
+    bumped inside a transaction, so the cost is one read and one write no
+    matter how many experiments exist, and concurrent /api/start calls (other
+    threads or other Cloud Run instances) never get overlapping slices.
+    """
+
+    def __init__(self, db, counter_path=(u'counters', u'trial_slices'), size=TRIALS_PER_EXPERIMENT):
+        self.db = db
+        self.counter_ref = db.collection(counter_path[0]).document(counter_path[1])
+        self.size = size
+        # Threads of this process queue up here instead of making each other's
+        # transactions retry
+        self._lock = threading.Lock()
+
+    def allocate(self, row_count):
+        """
+        Returns the next (start, end) slice, or None once the design is exhausted.
+        The last usable row is row_count-1, as it has always been.
+        """
+        with self._lock:
+            transaction = self.db.transaction(max_attempts=20)
+            return _allocate_in_transaction(transaction, self, row_count - 1)
+
+    def seed_index(self):
+        """
+        Where to start when the counter document doesn't exist yet: the end of
+        the newest experiment, so switching over from the old scan continues
+        where it left off. Reads at most one document.
+        """
+        latest = self.db.collection(u'experiments').order_by(
+            u'createdAt', direction=firestore.Query.DESCENDING).limit(1).stream()
+        for doc in latest:
+            count_firestore(reads=1)
+            return doc.to_dict().get('ends_at_trial_index', 0)
+        return 0
+
+
+@firestore.transactional
+def _allocate_in_transaction(transaction, allocator, last_index):
+    snapshot = allocator.counter_ref.get(transaction=transaction)
+    count_firestore(reads=1)
+    if (snapshot.exists):
+        start = snapshot.to_dict()['next_trial_index']
+    else:
+        start = allocator.seed_index()
+    if (start >= last_index):
+        return None
+    end = min(start + allocator.size, last_index)
+    transaction.set(allocator.counter_ref, {
+        u'next_trial_index': end,
+        u'updatedAt': datetime.datetime.now(),
+    })
+    count_firestore(writes=1)
+    return start, end
+
+
+class InProgressLeaseQueue:
+    """
+    The inprogress collection as a queue of leased slices, used once the
+    design is exhausted.
+
+    Every entry records its slice and a leaseExpiresAt. A claim takes the entry
+    whose lease expired longest ago and deletes it inside a transaction, so two
+    participants can never claim the same entry; leases still held are never
+    handed out. The claimer then writes its own entry with a fresh lease. Each
+    claim reads a single queue entry, and overflow traffic rotates through the
+    unfinished slices instead of piling onto one.
+
+    Entries written before leases existed have no leaseExpiresAt and are
+    invisible to claims until backfill() has run once.
+    """
+
+    def __init__(self, db, lease_seconds=LEASE_SECONDS):
+        self.db = db
+        self.collection_ref = db.collection(u'inprogress')
+        self.lease_seconds = lease_seconds
+
+    def entry(self, experiment_id, start, end):
+        """ (doc_ref, data) for a new lease, to be written with the experiment """
+        return (self.collection_ref.document(experiment_id),
+                new_lease(experiment_id, start, end, self.lease_seconds))
+
+    def claim(self):
+        """ Returns the inprogress entry that was claimed, or None if the queue is empty """
+        transaction = self.db.transaction(max_attempts=20)
+        return _claim_in_transaction(transaction, self)
+
+    def release(self, start, end):
+        """ Queue [start, end) under a new entry whose lease has already run out """
+        doc_ref = self.collection_ref.document()
+        doc_ref.set(new_lease(doc_ref.id, start, end, lease_seconds=0))
+        count_firestore(writes=1)
+
+    def backfill(self):
+        """
+        Give pre-lease entries their experiment's slice and a lease that ran
+        out lease_seconds after they were created. Entries whose experiment is
+        gone or completed are deleted. Returns (updated, deleted).
+        """
+        # firestore_storage imports this module, so not at the top
+        from firestore_storage import MAX_BATCH_WRITES
+        experiments_ref = self.db.collection(u'experiments')
+        batch, pending, updated, deleted = self.db.batch(), 0, 0, 0
+        for doc in self.collection_ref.stream():
+            entry = doc.to_dict()
+            count_firestore(reads=1)
+            if (u'leaseExpiresAt' in entry):
+                continue
+            info = experiments_ref.document(doc.id).get().to_dict()
+            count_firestore(reads=1)
+            if (not info or info.get('completed')):
+                batch.delete(doc.reference)
+                deleted += 1
+            else:
+                created = entry.get(u'createdAt') or datetime.datetime.now(datetime.timezone.utc)
+                batch.set(doc.reference, {
+                    u'experimentID': doc.id,
+                    u'starts_from_trial_index': info['starts_from_trial_index'],
+                    u'ends_at_trial_index': info['ends_at_trial_index'],
+                    u'leaseExpiresAt': created + datetime.timedelta(seconds=self.lease_seconds),
+                }, merge=True)
+                updated += 1
+            pending += 1
+            if (pending == MAX_BATCH_WRITES):
+                batch.commit()
+                count_firestore(writes=pending)
+                batch, pending = self.db.batch(), 0
+        if (pending):
+            batch.commit()
+            count_firestore(writes=pending)
+        return updated, deleted
+
+
+@firestore.transactional
+def _claim_in_transaction(transaction, queue):
+    # Only leases that have run out, longest-expired first
+    now = datetime.datetime.now(datetime.timezone.utc)
+    query = (queue.collection_ref.where(u'leaseExpiresAt', u'<=', now)
+             .order_by(u'leaseExpiresAt').limit(1))
+    for doc in query.stream(transaction=transaction):
+        transaction.delete(doc.reference)
+        count_firestore(reads=1, writes=1)
+        return doc.to_dict()
+    return None
@@ -1,10 +1,15 @@
 import os
-from flask import Flask, request, abort, jsonify
-from admin import experiment_ref, experiment_type_ref, db, firestore
-import subprocess
-import datetime
-import pandas as pd
+import threading
+import time
+from flask import Flask, Response, g, request, abort, jsonify, stream_with_context
 from experiment import Experiment
+from types_cache import experiment_types
+from catalog import artwork_catalog
+from trial_store import trial_design
+from payloads import compiled_payloads
+from live_scores import live_scores
+from metrics import registry, current_timings
+import export
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -12,6 +17,41 @@ CORS(app, resources={
      r"/api/*": {"origins": ["http://localhost:3000", "https://thelettersproject.web.app"]}})
 
 
+def prewarm():
+    """
+    Load the caches /api/start needs, so the first participant doesn't pay for
+    them. Runs in the background; the server answers health checks meanwhile.
+    """
+    for warm in (experiment_types.get, trial_design.ensure_loaded,
+                 artwork_catalog.ensure_loaded, compiled_payloads.ensure_loaded):
+        try:
+            warm()
+        except Exception as e:
+            print("Prewarm failed:", e)
+
+
+# ARTRATER_PREWARM=0 leaves everything to be loaded by the first request
+if (os.environ.get('ARTRATER_PREWARM', '1') != '0'):
+    threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+
+
+@app.before_request
+def start_timer():
+    g.started_at = time.perf_counter()
+
+
+@app.after_request
+def add_server_timing(response):
+    if ('started_at' not in g):
+        return response
+    total = time.perf_counter() - g.started_at
+    registry.observe("artrater_request_seconds",
+                     {"endpoint": request.url_rule.rule if request.url_rule else "unmatched",
+                      "status": response.status_code}, total)
+    response.headers["Server-Timing"] = current_timings().server_timing(total)
+    return response
+
+
 @app.route('/api')
 def hello_world():
     return 'This is an entry point to backend services for the Letter Project\'s platform for rating van Gogh\'s artworks'
@@ -40,6 +80,96 @@ def get_experiment_by_id():
     e.set_existing_experiment_from_id(eid)
     return jsonify({"experimentID":e.get_experiment_id(),"info":e.get_experiment_info(),"trials":e.get_trials()})
 
+def load_responses_request():
+    post_data = request.get_json(silent=True) or {}
+    if (not isinstance(post_data, dict)):
+        abort(400, "Body must be a JSON object")
+    eid = post_data.get("experimentID")
+    responses = post_data.get("responses", [])
+    if (not eid):
+        abort(422, "Missing experimentID")
+    if (not isinstance(responses, list)):
+        abort(400, "responses must be a list")
+    for r in responses:
+        if (not isinstance(r, dict) or any(r.get(k) is None for k in ("trialID", "best", "worst"))):
+            abort(400, "Each response needs trialID, best and worst")
+    e = Experiment(experiment_id=eid)
+    return e, responses
+
+
+@app.route("/api/responses", methods=["POST"])
+def record_responses():
+    """
+    Save a batch of choices, {"experimentID", "responses": [{"trialID", "best", "worst"}]},
+    in one write. Can be called as often as the client likes, e.g. every few trials.
+    """
+    e, responses = load_responses_request()
+    e.record_responses(responses)
+    return jsonify({"experimentID": e.get_experiment_id(), "recorded": len(responses)})
+
+
+@app.route("/api/complete", methods=["POST"])
+def complete_experiment():
+    """
+    Same body as /api/responses. Saves the remaining choices, marks the
+    experiment completed and frees its inprogress entry in a single batch.
+    """
+    e, responses = load_responses_request()
+    e.complete_experiment(responses)
+    return jsonify({"experimentID": e.get_experiment_id(), "completed": True, "recorded": len(responses)})
+
+
+def require_admin():
+    token = os.environ.get('ADMIN_TOKEN')
+    if (not token or request.headers.get('X-Admin-Token') != token):
+        abort(403)
+
+
+@app.route("/api/admin/types/invalidate", methods=["POST"])
+def invalidate_experiment_types():
+    """
+    Reload the cached experiment_types on this instance. The snapshot listener
+    normally does this on its own; this is for when a change has to be live
+    immediately.
+    """
+    require_admin()
+    types = experiment_types.invalidate()
+    return jsonify({"types": len(types)})
+
+
+@app.route("/api/admin/export")
+def export_responses():
+    """
+    Stream answered trials as csv (score_trials.py format) or ndjson.
+    Optional: type=<experiment type>, cursor=<experiment id to resume after>.
+    Only ndjson carries resume cursors; for large exports prefer
+    export_responses.py, which checkpoints to disk.
+    """
+    require_admin()
+    type = request.args.get('type')
+    cursor = request.args.get('cursor')
+    if (request.args.get('format', 'csv') == 'ndjson'):
+        return Response(stream_with_context(export.stream_ndjson(type=type, after=cursor)), mimetype="application/x-ndjson")
+    return Response(stream_with_context(export.stream_csv(type=type, after=cursor)), mimetype="text/csv")
+
+
+@app.route("/api/scores")
+def scores():
+    """
+    Current leaderboard of one experiment type, with every live scoring
+    method per item. Only recomputed when new experiments have been completed.
+    """
+    require_admin()
+    type = request.args.get('type')
+    if (not type):
+        abort(422, "Missing experiment type (type)")
+    return jsonify(live_scores.get(type))
+
+
+@app.route("/api/metrics")
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
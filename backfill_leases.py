@@ -0,0 +1,21 @@
+"""
+One-off migration for the inprogress lease queue: entries written before
+leases existed have no leaseExpiresAt, so claims never see them. This gives
+each one its experiment's slice and an already-expired lease, and deletes
+entries of experiments that are gone or completed. Safe to run again.
+
+    python backfill_leases.py
+"""
+import sys
+
+from admin import get_db
+from allocator import InProgressLeaseQueue
+
+
+def main(argv=sys.argv[1:]):
+    updated, deleted = InProgressLeaseQueue(get_db()).backfill()
+    print("Backfilled %d inprogress entries, deleted %d stale ones" % (updated, deleted))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
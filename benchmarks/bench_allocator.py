@@ -0,0 +1,85 @@
+"""
+Compares the old "stream every experiment" slice lookup with TrialSliceAllocator
+as the experiments collection grows.
+
+Runs against the Firestore emulator so it never touches the live project:
+
+    gcloud emulators firestore start --host-port=localhost:8081
+    FIRESTORE_EMULATOR_HOST=localhost:8081 python benchmarks/bench_allocator.py
+
+Each round allocates from 8 threads at once, like the gunicorn config in the
+Dockerfile, and checks that no two slices overlap.
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import firestore
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from allocator import TrialSliceAllocator
+
+
+def populate(db, total):
+    """ Grow the experiments collection to `total` documents """
+    existing = len(list(db.collection(u'experiments').select([]).stream()))
+    batch = db.batch()
+    for i in range(existing, total):
+        batch.set(db.collection(u'experiments').document(), {
+            u'createdAt': datetime.datetime.now(),
+            u'starts_from_trial_index': i * 20,
+            u'ends_at_trial_index': i * 20 + 20,
+        })
+        if ((i + 1) % 500 == 0):
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def legacy_lookup(db):
+    docs = db.collection(u'experiments').order_by(
+        u'createdAt', direction=firestore.Query.DESCENDING).stream()
+    prev = [d.to_dict() for d in docs]
+    return prev[0]['ends_at_trial_index'] if prev else 0
+
+
+def timed(fn):
+    t = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - t) * 1000, result
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Benchmark trial slice allocation against collection size.')
+    parser.add_argument("--sizes", type=str, default="100,1000,5000", help="Comma-separated experiments collection sizes.")
+    parser.add_argument("--calls", type=int, default=40, help="Allocations per size.")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent callers.")
+    parser.add_argument("--project", type=str, default="bench-allocator")
+    args = parser.parse_args(argv)
+
+    if (not os.environ.get("FIRESTORE_EMULATOR_HOST")):
+        sys.exit("Set FIRESTORE_EMULATOR_HOST; this benchmark only runs against the emulator.")
+
+    db = firestore.Client(project=args.project)
+    allocator = TrialSliceAllocator(db)
+    row_count = 10 ** 9
+
+    print("experiments,legacy_ms_median,allocator_ms_median,allocator_ms_p95,overlaps")
+    for size in [int(v) for v in args.sizes.split(",")]:
+        populate(db, size)
+        legacy = [timed(lambda: legacy_lookup(db))[0] for _ in range(3)]
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(lambda _: timed(lambda: allocator.allocate(row_count)), range(args.calls)))
+        times = sorted(r[0] for r in results)
+        slices = sorted(r[1] for r in results)
+        overlaps = sum(1 for a, b in zip(slices, slices[1:]) if a[1] > b[0])
+        print("%d,%.1f,%.1f,%.1f,%d" % (size, statistics.median(legacy), statistics.median(times),
+                                         times[int(len(times) * 0.95) - 1], overlaps))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
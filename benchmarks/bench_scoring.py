@@ -0,0 +1,68 @@
+"""
+Compares scoring methods on the workloads of bestworst/simulate_results.py:
+items with normally distributed latent values, trials from trialgen's
+"even" generator, and choices made by sorting each trial on latent value
+plus gaussian noise. For every method it reports the time taken and the
+correlation of the scores with the latent values.
+
+    python benchmarks/bench_scoring.py
+    python benchmarks/bench_scoring.py --items 1000 --N 4000,16000 --noise 0.5,1.0 --engine numpy
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bestworst"))
+import scoring
+import trialgen
+
+METHODS = ["ABW", "BestWorst", "David", "Elo", "Value", "RW", "BradleyTerry", "MaxDiff"]
+
+
+def simulate(num_items, N, K, noise, rng):
+    """ Trials as (best, worst, (others)), and the latent value of each item; rng is a random.Random """
+    items = ["item%d" % i for i in range(num_items)]
+    latent = dict((item, rng.gauss(0, 1)) for item in items)
+    trials = []
+    for trial in trialgen.build_trials_even(items, N=N, K=K, rng=rng):
+        ranked = sorted(trial, key=lambda item: latent[item] + rng.gauss(0, noise), reverse=True)
+        trials.append((ranked[0], ranked[-1], tuple(ranked[1:-1])))
+    return trials, latent
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Time and accuracy of best-worst scoring methods.")
+    parser.add_argument("--items", type=int, default=400, help="Number of items.")
+    parser.add_argument("--N", type=str, default="2000,8000", help="Comma-separated numbers of trials.")
+    parser.add_argument("--K", type=int, default=4, help="Items per trial.")
+    parser.add_argument("--noise", type=str, default="0.5,1.0", help="Comma-separated decision noise sds.")
+    parser.add_argument("--methods", type=str, default=",".join(METHODS), help="Comma-separated scoring methods.")
+    parser.add_argument("--engine", type=str, default="python", help="Engine for Elo, Value and RW: python, numpy or numba.")
+    parser.add_argument("--iters", type=int, default=100, help="Iterations for Elo, Value and RW.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    simulation_stream, scoring_stream = np.random.SeedSequence(args.seed).spawn(2)
+    rng = random.Random(int(simulation_stream.generate_state(1)[0]))
+    scoring_rng = np.random.default_rng(scoring_stream)
+    methods = args.methods.split(",")
+    print("%6s %6s %-13s %9s %8s" % ("N", "noise", "method", "seconds", "r"))
+    for N in [int(v) for v in args.N.split(",")]:
+        for noise in [float(v) for v in args.noise.split(",")]:
+            trials, latent = simulate(args.items, N, args.K, noise, rng)
+            items = sorted(latent)
+            for method in methods:
+                began = time.perf_counter()
+                results = scoring.score_trials(trials, [method], iters=args.iters, engine=args.engine, rng=scoring_rng)
+                elapsed = time.perf_counter() - began
+                scores = [scoring.scoring_methods[method](results[item]) for item in items]
+                r = np.corrcoef(scores, [latent[item] for item in items])[0, 1]
+                print("%6d %6.2f %-13s %9.3f %8.4f" % (N, noise, method, elapsed, r))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Measures cold-start time: how long after the server process is launched the
+first bytes of GET /api and POST /api/start come back.
+
+By default the server runs on MemoryStorage with local fixtures (see
+load_test.py), so what is measured is import and cache-loading time, not the
+network:
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --no-prewarm
+
+Pass --firestore to start the server with the environment as-is instead.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from load_test import write_fixtures
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER = "import sys; sys.path.insert(0, %r); from app import app; app.run(port=int(sys.argv[1]), threaded=True)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_first_byte(fn, deadline):
+    """ Retry fn until the server accepts the connection; returns when the response arrives """
+    while time.perf_counter() < deadline:
+        try:
+            return fn()
+        except requests.ConnectionError:
+            time.sleep(0.005)
+    raise RuntimeError("Server did not come up in time")
+
+
+def measure(env):
+    port = free_port()
+    url = "http://127.0.0.1:%d" % port
+    launched = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", SERVER % ROOT, str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = launched + 120
+        wait_for_first_byte(lambda: requests.get(url + "/api", stream=True), deadline)
+        api = time.perf_counter() - launched
+        res = requests.post(url + "/api/start", json={"prolificID": "startup-bench"}, stream=True)
+        start = time.perf_counter() - launched
+        if (res.status_code != 200):
+            raise RuntimeError("/api/start returned %d" % res.status_code)
+        return api, start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for the backend.')
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure.")
+    parser.add_argument("--no-prewarm", action="store_true", help="Start with ARTRATER_PREWARM=0.")
+    parser.add_argument("--firestore", action="store_true", help="Use the environment as-is instead of MemoryStorage and local fixtures.")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env["ARTRATER_PREWARM"] = "0" if args.no_prewarm else "1"
+    if (not args.firestore):
+        folder = tempfile.mkdtemp(prefix="artrater-startup-")
+        catalog, design = write_fixtures(folder, artworks=5000, rows=50000)
+        env.update({"ARTRATER_STORAGE": "memory", "ARTWORK_CSV_PATH": catalog, "TRIAL_DESIGN_PATH": design})
+
+    results = [measure(env) for _ in range(args.runs)]
+    print("ttfb,median_ms,max_ms")
+    for name, values in (("/api", [r[0] for r in results]), ("/api/start", [r[1] for r in results])):
+        print("%s,%.0f,%.0f" % (name, statistics.median(values) * 1000, max(values) * 1000))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Load test for /api/start and /api/experiment.
+
+By default the app runs in-process against MemoryStorage, with a synthetic
+artwork catalog and trial design, so no Firebase project or network is needed:
+
+    python benchmarks/load_test.py --requests 500 --concurrency 8 --latency-ms 40
+
+--latency-ms is the simulated Firestore round-trip time. Pass --url to drive a
+running server instead (e.g. a staging deploy or `python app.py`).
+
+Each participant POSTs /api/start and then GETs /api/experiment for the
+experiment it was given, like a participant resuming a session.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def write_fixtures(folder, artworks, rows, K=4):
+    """ A synthetic catalog and design, shaped like the real csv files """
+    catalog = os.path.join(folder, "artwork.csv")
+    with open(catalog, "w") as f:
+        f.write("id,img,title\n")
+        for i in range(artworks):
+            f.write("%d,https://example.org/%d.jpg,Artwork %d\n" % (i, i, i))
+    design = os.path.join(folder, "trials.csv")
+    with open(design, "w") as f:
+        f.write(",".join([""] + [str(k) for k in range(K)]) + "\n")
+        for r in range(rows):
+            f.write(",".join([str(r)] + [str((r * K + k) % artworks) for k in range(K)]) + "\n")
+    return catalog, design
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def __client(self):
+        if (not hasattr(self.local, "client")):
+            self.local.client = self.app.test_client()
+        return self.local.client
+
+    def start(self, prolific_id):
+        res = self.__client().post("/api/start", json={"prolificID": prolific_id})
+        return res.status_code, res.get_json()
+
+    def experiment(self, eid):
+        res = self.__client().get("/api/experiment", query_string={"eid": eid})
+        return res.status_code, res.get_json()
+
+
+class HttpClient:
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def start(self, prolific_id):
+        res = self.session.post(self.url + "/api/start", json={"prolificID": prolific_id})
+        return res.status_code, res.json() if res.ok else None
+
+    def experiment(self, eid):
+        res = self.session.get(self.url + "/api/experiment", params={"eid": eid})
+        return res.status_code, res.json() if res.ok else None
+
+
+def percentile(sorted_values, p):
+    if (not sorted_values):
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "endpoint": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def run(client, total, concurrency):
+    results = {"start": [], "experiment": []}
+    errors = {"start": 0, "experiment": 0}
+    lock = threading.Lock()
+
+    def participant(i):
+        t = time.perf_counter()
+        status, body = client.start("loadtest-%d" % i)
+        start_time = time.perf_counter() - t
+        with lock:
+            if (status == 200):
+                results["start"].append(start_time)
+            else:
+                errors["start"] += 1
+        if (status != 200):
+            return
+        t = time.perf_counter()
+        status, _ = client.experiment(body["experimentID"])
+        experiment_time = time.perf_counter() - t
+        with lock:
+            if (status == 200):
+                results["experiment"].append(experiment_time)
+            else:
+                errors["experiment"] += 1
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(participant, range(total)))
+    elapsed = time.perf_counter() - began
+    return [summarize("/api/start", results["start"], errors["start"], elapsed),
+            summarize("/api/experiment", results["experiment"], errors["experiment"], elapsed)]
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Load test for the experiment endpoints.')
+    parser.add_argument("--url", type=str, default=None, help="Base URL of a running server. Defaults to an in-process app on MemoryStorage.")
+    parser.add_argument("--requests", type=int, default=200, help="Number of simulated participants.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Participants in flight at once.")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated Firestore round-trip latency (in-process only).")
+    parser.add_argument("--artworks", type=int, default=1000, help="Synthetic catalog size (in-process only).")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of csv.")
+    args = parser.parse_args(argv)
+
+    if (args.url):
+        client = HttpClient(args.url)
+    else:
+        folder = tempfile.mkdtemp(prefix="artrater-load-")
+        catalog, design = write_fixtures(folder, args.artworks, rows=args.requests * 20 + 1)
+        os.environ["ARTRATER_STORAGE"] = "memory"
+        os.environ["ARTRATER_STORAGE_LATENCY_MS"] = str(args.latency_ms)
+        os.environ["ARTWORK_CSV_PATH"] = catalog
+        os.environ["TRIAL_DESIGN_PATH"] = design
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        from app import app
+        client = InProcessClient(app)
+
+    summary = run(client, args.requests, args.concurrency)
+    if (args.json):
+        print(json.dumps(summary, indent=2))
+    else:
+        print("endpoint,requests,errors,p50_ms,p95_ms,p99_ms,throughput_rps")
+        for s in summary:
+            print("%(endpoint)s,%(requests)d,%(errors)d,%(p50_ms)s,%(p95_ms)s,%(p99_ms)s,%(throughput_rps)s" % s)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+array_scoring.py
+
+Array-backed versions of the error-correction scoring methods in scoring.py
+(Elo, Value and Rescorla-Wagner). Items are mapped to integer indices and
+their ratings are kept in NumPy arrays, so the work per pairing is done by
+NumPy (or numba) instead of ItemEntry method calls.
+
+Two engines, both selected through scoring.score_trials(..., engine=...):
+  numpy - pairings are processed in chunks. Every update in a chunk is
+          computed from the ratings at the start of the chunk and then summed
+          per item with np.bincount (a Jacobi-style step). Each item's pairings
+          are spread evenly over a pass's chunks, so no item is in more than
+          a few pairings of any chunk; that includes the dummy players, which
+          play every item. The results are statistically equivalent to the
+          sequential updates: rank correlations with engine="python" are as
+          high as those between two engine="python" runs, on small designs
+          and large ones alike.
+  numba - the exact sequential updates of scoring.py, compiled. Needs numba.
+"""
+import numpy as np
+import scoring
+
+RATINGS = ("elo", "value", "reswag")
+
+# Pairings per chunk, per item. At 2 an item is in about 2-4 pairings of a
+# chunk; larger chunks are faster but their summed updates start to overshoot.
+ITEM_REPEATS_PER_CHUNK = 2
+# Pairings of any one item per chunk that a pass is split finely enough for.
+# Items in far more pairings than the rest, like the dummy players, would
+# otherwise have hundreds of updates summed in one step, and overshoot: a
+# Value update moves an item at most 0.025 of the way to 0 or 1, so summing
+# more than 40 of them can leave (0, 1). 16 keeps well clear of that.
+MAX_ITEM_REPEATS = 16
+
+
+def update_chunk(w, l, rate, elo, value, rw_win, rw_lose, ratings=RATINGS):
+    """Applies the updates of the pairings (w[i], l[i]), all computed from
+       the current ratings and summed per item. Only the ratings named in `ratings` are updated.
+    """
+    if "elo" in ratings:
+        Qw = 10 ** (elo[w] / 400.)
+        Ql = 10 ** (elo[l] / 400.)
+        delta = 30.0 * (1. - Qw / (Qw + Ql))
+        elo += np.bincount(w, weights=delta, minlength=len(elo))
+        elo -= np.bincount(l, weights=delta, minlength=len(elo))
+
+    if "value" in ratings:
+        rwin = value[w] / (1.0 - value[w])
+        rlos = value[l] / (1.0 - value[l])
+        salience = 1.0 - rwin / (rwin + rlos)
+        Dw = salience * rate * (1.0 - value[w])
+        Dl = salience * rate * (0   - value[l])
+        value += np.bincount(w, weights=Dw, minlength=len(value))
+        value += np.bincount(l, weights=Dl, minlength=len(value))
+
+    if "reswag" in ratings:
+        # 50/50 in the case of no exposure
+        w_v_tot = rw_win[w] + rw_lose[w]
+        l_v_tot = rw_win[l] + rw_lose[l]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w_pwin = np.where(w_v_tot != 0, rw_win[w] / w_v_tot, 0.5)
+            l_pwin = np.where(l_v_tot != 0, rw_win[l] / l_v_tot, 0.5)
+            rwin = w_pwin / np.maximum(0.0001, 1.0 - w_pwin)
+            rlos = l_pwin / np.maximum(0.0001, 1.0 - l_pwin)
+            salience = np.where(rwin + rlos != 0, 1.0 - rwin / (rwin + rlos), 1.0)
+        rw_win  += np.bincount(w, weights=salience * rate * (1.0 - w_v_tot), minlength=len(rw_win))
+        rw_lose += np.bincount(l, weights=salience * rate * (1.0 - l_v_tot), minlength=len(rw_lose))
+
+def rating_arrays(elo, value, rw_win, rw_lose):
+    """The ratings as scoring.rating_scores reads them off items"""
+    total = rw_win + rw_lose
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reswag = np.where(total != 0, rw_win / total, 0.5)
+    return {"elo": elo.copy(), "value": value.copy(), "reswag": reswag}
+
+def relative_change(previous, current):
+    """array version of scoring.relative_change"""
+    n = len(current)
+    if n == 0:
+        return 0.0
+    ordered = np.sort(current)
+    spread = ordered[(3*n)//4] - ordered[n//4] if n > 1 else 0.0
+    return float(np.mean(np.abs(current - previous)) / max(spread, 1e-12))
+
+class Convergence(scoring.Convergence):
+    """scoring.Convergence, measuring the changes on the rating arrays"""
+    def __init__(self, ratings, tol, state):
+        scoring.Convergence.__init__(self, ratings, tol)
+        self.previous = rating_arrays(*state)
+
+    def measure(self, iteration, state):
+        """records the end of an iteration; returns the ratings still active"""
+        current = rating_arrays(*state)
+        changes = dict((r, relative_change(self.previous[r], current[r])) for r in self.active)
+        self.previous = current
+        return self.update(iteration, changes)
+
+def occurrences(ids, num_items):
+    """For each entry of ids, how many earlier entries hold the same id"""
+    by_id = np.argsort(ids, kind="stable")
+    sorted_ids = ids[by_id]
+    first = np.searchsorted(sorted_ids, np.arange(num_items))
+    occurrence = np.empty(len(ids), dtype=np.int64)
+    occurrence[by_id] = np.arange(len(ids)) - first[sorted_ids]
+    return occurrence
+
+def split_pass(order, winners, losers, degree, num_chunks):
+    """Splits one pass's order of pairings into num_chunks chunks. A pairing
+       goes where its busier item's pairings are spread evenly over the
+       pass: that item's j-th of its d pairings into chunk j/d * num_chunks.
+       The busiest items, like the dummy players, are then in at most
+       d/num_chunks + 1 pairings of a chunk; the rest follow their opponents
+       into chunks at random. Pairings keep their order within a chunk.
+    """
+    w, l = winners[order], losers[order]
+    ids = np.empty(2 * len(order), dtype=np.int64)
+    ids[0::2], ids[1::2] = w, l
+    occurrence = occurrences(ids, len(degree))
+    position = np.where(degree[w] >= degree[l], occurrence[0::2] / degree[w], occurrence[1::2] / degree[l])
+    chunks = (position * num_chunks).astype(np.int64)
+    by_chunk = np.argsort(chunks, kind="stable")
+    bounds = np.searchsorted(chunks[by_chunk], np.arange(1, num_chunks))
+    return np.split(order[by_chunk], bounds)
+
+def initial_state(num_items):
+    """elo, value, reswag_win and reswag_lose arrays as a new ItemEntry has them"""
+    return (np.zeros(num_items), np.full(num_items, 0.5), np.zeros(num_items), np.zeros(num_items))
+
+def run_numpy(winners, losers, num_items, iters=100, chunk=None, ratings=RATINGS, tol=None, report=None, state=None,
+              rng=None):
+    """Chunked Jacobi-style passes over the pairings. Returns the elo, value,
+       reswag_win and reswag_lose arrays; state gives their starting values,
+       which are updated in place. Chunk orders are drawn from rng (see
+       scoring.make_rng).
+    """
+    rng = scoring.make_rng(rng)
+    if state is None:
+        state = initial_state(num_items)
+    elo, value, rw_win, rw_lose = state
+    if chunk is None:
+        chunk = max(1, int(num_items * ITEM_REPEATS_PER_CHUNK))
+    # enough chunks for the target size, and for the busiest item to be in
+    # no more than MAX_ITEM_REPEATS pairings of each
+    degree = (np.bincount(winners, minlength=num_items) + np.bincount(losers, minlength=num_items)).astype(np.float64)
+    busiest = int(degree.max()) if len(winners) else 0
+    num_chunks = max(1, -(-len(winners) // chunk), -(-busiest // MAX_ITEM_REPEATS))
+    convergence = Convergence(ratings, tol, state)
+    measure = tol is not None or report is not None
+    active  = list(ratings)
+
+    for i in range(iters):
+        rate  = 0.025 / (i+1)
+        order = rng.permutation(len(winners))
+        for idx in split_pass(order, winners, losers, degree, num_chunks):
+            update_chunk(winners[idx], losers[idx], rate, elo, value, rw_win, rw_lose, active)
+        convergence.iterations = i+1
+        if measure:
+            active = convergence.measure(i+1, state)
+            if not active:
+                break
+    convergence.fill_report(report)
+    return state
+
+def _sequential_kernel(winners, losers, orders, first, elo, value, rw_win, rw_lose, do_elo, do_value, do_reswag):
+    """The loop of scoring.run_error_correction_scoring over index arrays,
+       for numba to compile. orders[i] is the pairing order of iteration
+       first+i.
+    """
+    for i in range(orders.shape[0]):
+        rate = 0.025 / (first+i+1)
+        for j in orders[i]:
+            w = winners[j]
+            l = losers[j]
+
+            if do_elo:
+                Qw = 10 ** (elo[w] / 400.)
+                Ql = 10 ** (elo[l] / 400.)
+                delta = 30.0 * (1. - Qw / (Qw + Ql))
+                elo[w] += delta
+                elo[l] -= delta
+
+            if do_value:
+                rwin = value[w] / (1.0 - value[w])
+                rlos = value[l] / (1.0 - value[l])
+                salience = 1.0 - rwin / (rwin + rlos)
+                Dw = salience * rate * (1.0 - value[w])
+                Dl = salience * rate * (0   - value[l])
+                value[w] += Dw
+                value[l] += Dl
+
+            if do_reswag:
+                w_v_tot = rw_win[w] + rw_lose[w]
+                l_v_tot = rw_win[l] + rw_lose[l]
+                w_pwin = rw_win[w] / w_v_tot if w_v_tot != 0 else 0.5
+                l_pwin = rw_win[l] / l_v_tot if l_v_tot != 0 else 0.5
+                rwin = w_pwin / max(0.0001, 1.0 - w_pwin)
+                rlos = l_pwin / max(0.0001, 1.0 - l_pwin)
+                salience = 1.0 - rwin / (rwin + rlos) if rwin + rlos != 0 else 1.0
+                rw_win[w]  += salience * rate * (1.0 - w_v_tot)
+                rw_lose[l] += salience * rate * (1.0 - l_v_tot)
+
+_compiled_kernel = None
+
+def run_numba(winners, losers, num_items, iters=100, ratings=RATINGS, tol=None, report=None, state=None,
+              rng=None):
+    """Exact sequential passes, compiled with numba on first use. Returns the
+       same arrays as run_numpy, and takes the same state and rng.
+    """
+    rng = scoring.make_rng(rng)
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        import numba
+        _compiled_kernel = numba.njit(cache=True)(_sequential_kernel)
+
+    if state is None:
+        state = initial_state(num_items)
+    convergence = Convergence(ratings, tol, state)
+    measure = tol is not None or report is not None
+    active  = list(ratings)
+
+    # one call per iteration, so only one iteration's order is held at a
+    # time and convergence can be checked in between
+    for i in range(iters):
+        flags = ("elo" in active, "value" in active, "reswag" in active)
+        order = rng.permutation(len(winners)).astype(np.int32).reshape(1, len(winners))
+        _compiled_kernel(winners, losers, order, i, *(state + flags))
+        convergence.iterations = i+1
+        if measure:
+            active = convergence.measure(i+1, state)
+            if not active:
+                break
+    convergence.fill_report(report)
+    return state
+
+def run_error_correction_scoring(item_data, pairings, iters=100, engine="numpy", ratings=None, tol=None, report=None,
+                                 rng=None):
+    """Drop-in replacement for scoring.run_error_correction_scoring. Ratings
+       are written back to the ItemEntry objects in item_data, which is also
+       returned. As there, ratings=None updates every rating and also sets
+       the win/loss tallies and David scores. tol, report and rng work as in
+       scoring.run_error_correction_scoring.
+    """
+    full = ratings is None
+    if full:
+        ratings = RATINGS
+    if not ratings:
+        scoring.Convergence(ratings, tol).fill_report(report)
+        return item_data
+    # the tallies below need the number of iterations run
+    if full and report is None:
+        report = { }
+    if not isinstance(pairings, scoring.Pairings):
+        pairings = scoring.Pairings.from_list(pairings)
+    items, winners, losers = pairings.items, pairings.winners, pairings.losers
+    # start from the entries' ratings, so runs can continue earlier ones
+    state = tuple(np.array([ getattr(item_data[item], field) for item in items ], dtype=np.float64)
+                  for field in scoring.RATING_FIELDS)
+    if engine == "numba":
+        elo, value, rw_win, rw_lose = run_numba(winners, losers, len(items), iters=iters, ratings=ratings,
+                                                tol=tol, report=report, state=state, rng=rng)
+    else:
+        elo, value, rw_win, rw_lose = run_numpy(winners, losers, len(items), iters=iters, ratings=ratings,
+                                                tol=tol, report=report, state=state, rng=rng)
+
+    for i, item in enumerate(items):
+        entry = item_data[item]
+        if "elo" in ratings:
+            entry.elo         = float(elo[i])
+        if "value" in ratings:
+            entry.value       = float(value[i])
+        if "reswag" in ratings:
+            entry.reswag_win  = float(rw_win[i])
+            entry.reswag_lose = float(rw_lose[i])
+    if not full:
+        return item_data
+
+    # ItemEntry.win adds to wins/losses on every pass
+    scoring.tally_pairings(item_data, pairings, report["iterations"])
+    return item_data
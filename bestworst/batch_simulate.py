@@ -19,6 +19,7 @@ For published academic research using these tools, please cite:
     Methods, XX(X), 1-19. doi: 10.3758/s13428-017-0898-2
 """
 import sys, argparse, os
+import numpy as np
 
 def main(argv=sys.argv[1:]):
     parser = argparse.ArgumentParser(description='Interface for best-worst simulation')
@@ -33,14 +34,16 @@ def main(argv=sys.argv[1:]):
     parser.add_argument("--K", type=int, default=4, help="K sizes to try.")
     parser.add_argument("--sep", type=str, default=None, help="Column seperator for the input file")
     parser.add_argument("--dummy", type=bool, default=True, help="use a dummy player to bound tournament-based scores.")
-    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for. 100 is likely sufficient to ensure convergence, if not a little overkill.")
+    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for. 100 is likely sufficient to ensure convergence, if not a little overkill; with --tol, the most iterations to run.")
+    parser.add_argument("--tol", type=float, default=None, help="Stop iterating once no tournament score changes by more than this over an iteration (relative to its interquartile range), e.g. 0.001. Iterations run and final changes are reported on stderr.")
     parser.add_argument("--item", type=str, default="Item", help="Column corresponding to item name.")
     parser.add_argument("--latentvalue", type=str, default="LatentValue", help="Column corresponding to latent value name.")
     parser.add_argument("--num_simulations", type=int, default=100, help="Number of simulations per parameter set to run.")
     parser.add_argument("--dir", type=str, default="simulations", help="Destination folder to store simulations.")
     parser.add_argument("--label", type=str, default="", help="Optional string label to add to the front of every output file.")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed. Each simulation is given its own seed derived from it, so the whole batch can be reproduced.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     Ns         = [ int(v) for v in args.N.split(",") ]
     noises     = [ float(v) for v in args.noise.split(",") ]
@@ -48,13 +51,16 @@ def main(argv=sys.argv[1:]):
     
     # create the destination folder
     os.system("mkdir %s" % args.dir)
+
+    # simulations are given seeds spawned from the master seed, in order
+    seeds = np.random.SeedSequence(args.seed) if args.seed is not None else None
     
     # go through our combination of parameter sets and run the script with
     # each one
     for N in Ns:
         for noise in noises:
             for generator in generators:
-                for sim in xrange(args.num_simulations):
+                for sim in range(args.num_simulations):
                     # generate the name of the output file
                     # LatentValue_N_K_generator_noise_dummy_epoch.csv
                     fname = "%s_N%d_K%d_%s_noise%0.2f_dummy%s_sim%03d.csv" % \
@@ -67,8 +73,12 @@ def main(argv=sys.argv[1:]):
                     path = os.path.join(args.dir, fname)
 
                     # prepare the command
-                    cmd = "python scripts/simulate_results.py %s %d %d --noise=%f --generator=%s --item=%s --latentvalue=%s --dummy=%s --iters=%s" % \
-                          (args.input, N, args.K, noise, generator, args.item, args.latentvalue, str(args.dummy), args.iters)
+                    cmd = "%s scripts/simulate_results.py %s %d %d --noise=%f --generator=%s --item=%s --latentvalue=%s --dummy=%s --iters=%s" % \
+                          (sys.executable, args.input, N, args.K, noise, generator, args.item, args.latentvalue, str(args.dummy), args.iters)
+                    if args.tol is not None:
+                        cmd += " --tol=%f" % args.tol
+                    if seeds is not None:
+                        cmd += " --seed=%d" % seeds.spawn(1)[0].generate_state(1)[0]
                     
                     # run the simulation
                     os.system("%s > %s" % (cmd, path))
@@ -0,0 +1,296 @@
+"""
+bootstrap.py
+
+Bootstrap confidence intervals for best-worst scores. The trials, or whole
+participants' sets of trials, are resampled with replacement, each replicate
+is scored with scoring.score_trials, and the percentiles of every item's
+scores across replicates give its interval.
+
+Replicates are scored in a process pool. Each replicate gets its own RNG
+stream, spawned from one seed, for both resampling and scoring, so results
+are reproducible whatever the number of workers. Only a few replicates are in
+flight at a time, and every finished one is folded into a running P-square
+estimate (Jain & Chlamtac, 1985) of each interval bound; see QuantileSketch.
+What is kept per item, method and bound is fixed, so memory grows with the
+number of workers rather than with the number of replicates. Past the first
+EXACT_VALUES replicates the bounds are estimates, not exact sample
+percentiles: at 1000 replicates they are typically within 1% of the
+interval's width of the exact ones, far less than the percentiles' own
+sampling error.
+
+Usage:
+  python bootstrap.py data.csv --methods ABW,Value --replicates 1000 --participant experimentID
+"""
+import sys, argparse, os, warnings
+import numpy as np
+from multiprocessing import Pool
+import scoring
+from spreadsheet import Spreadsheet
+
+
+
+################################################################################
+# WORKERS
+################################################################################
+# set once per worker process by init_worker, instead of being sent with
+# every replicate
+_trials = None
+_groups = None
+_options = None
+
+def init_worker(trials, groups, options):
+    global _trials, _groups, _options
+    _trials  = trials
+    _groups  = groups
+    _options = options
+
+def score_replicate(seed_sequence):
+    """scores one resample. Returns a (num_items, num_methods) float32 array,
+       NaN for items that aren't in the resample.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    if _groups is None:
+        picks  = rng.integers(0, len(_trials), len(_trials))
+        sample = [ _trials[i] for i in picks ]
+    else:
+        picks  = rng.integers(0, len(_groups), len(_groups))
+        sample = [ trial for i in picks for trial in _groups[i] ]
+
+    methods = _options["methods"]
+    results = scoring.score_trials(sample, methods, iters=_options["iters"], dummy=_options["dummy"],
+                                   engine=_options["engine"], tol=_options["tol"], rng=rng)
+    return replicate_scores(results, _options["items"], methods)
+
+def replicate_scores(results, items, methods):
+    scores = np.full((len(items), len(methods)), np.nan, dtype=np.float32)
+    elos   = [ data.elo for name, data in results.items() if name in items ]
+    for name, data in results.items():
+        # skip dummy items
+        if name not in items:
+            continue
+        for j, method in enumerate(methods):
+            if method == "EloLogit":
+                scores[items[name], j] = scoring.scoring_methods[method](data, max(elos), min(elos))
+            else:
+                scores[items[name], j] = scoring.scoring_methods[method](data)
+    return scores
+
+
+
+################################################################################
+# QUANTILES
+################################################################################
+# values of each item, method and bound kept exactly before QuantileSketch
+# starts estimating; a constant, whatever the number of replicates
+EXACT_VALUES = 50
+
+# where QuantileSketch's markers go between the minimum and the median, as
+# multiples of the quantile's distance from the nearer end (0 or 1)
+MARKER_SPACING = [0.25, 0.5, 0.75, 1, 1.25, 1.5, 2, 3, 5]
+
+def marker_probs(p):
+    """quantiles the markers of an estimate of the p-quantile track: the
+       minimum, median and maximum, and closely spaced ones around p
+    """
+    tail  = min(p, 1 - p)
+    probs = [ 0.0, 1.0 ] + [ tail * k for k in MARKER_SPACING if tail * k < 0.5 ] + [ 0.5 ]
+    probs = np.unique(probs)
+    return probs if p <= 0.5 else 1 - probs[::-1]
+
+class QuantileSketch(object):
+    """Running estimates of the p-quantile of every cell of a stream of
+       equal-shaped arrays. NaN values are skipped, so each cell has its own
+       count. A cell's first `exact` values are kept, and its quantile is
+       exact while it has no more. They then place P-square markers at the
+       marker_probs(p) quantiles, which every later value moves, and the
+       one at p is the estimate. P-square's usual five markers and five
+       starting values leave the markers of extreme quantiles, like
+       interval bounds, far apart and badly placed; more of both keep the
+       estimates close.
+    """
+    def __init__(self, shape, p, exact=EXACT_VALUES):
+        self.p       = p
+        self.exact   = exact
+        self.count   = np.zeros(shape, dtype=np.int64)
+        self.kept    = np.full(shape + (exact,), np.nan, dtype=np.float32)
+        self.probs   = marker_probs(p)
+        self.marker  = int(np.argmin(np.abs(self.probs - p)))
+        # where the markers start among the sorted first values: as close to
+        # their quantiles as they can be while on distinct values
+        start = np.round(1 + (exact - 1) * self.probs)
+        for i in range(1, len(start)):
+            start[i] = max(start[i], start[i-1] + 1)
+        start[-1] = exact
+        for i in range(len(start) - 2, -1, -1):
+            start[i] = min(start[i], start[i+1] - 1)
+        self.start   = start
+        m = len(self.probs)
+        # marker heights, actual positions and desired positions
+        self.heights = np.full(shape + (m,), np.nan)
+        self.pos     = np.zeros(shape + (m,))
+        self.desired = np.zeros(shape + (m,))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        seen   = ~np.isnan(values)
+
+        filling = seen & (self.count < self.exact)
+        if filling.any():
+            cells = np.nonzero(filling)
+            self.kept[cells + (self.count[cells],)] = values[cells]
+            self.count[cells] += 1
+            # cells that just filled up get their markers
+            full = filling & (self.count == self.exact)
+            if full.any():
+                self.heights[full] = np.sort(self.kept[full], axis=-1)[:, self.start.astype(np.int64) - 1]
+                self.pos[full]     = self.start
+                self.desired[full] = 1 + (self.exact - 1) * self.probs
+
+        cells = np.nonzero(seen & ~filling)
+        if len(cells[0]) == 0:
+            return
+        self.count[cells] += 1
+        q, n, want, x = self.heights[cells], self.pos[cells], self.desired[cells], values[cells]
+
+        # widen the end markers if needed, and move up the positions of the
+        # markers above x
+        m = len(self.probs)
+        q[:, 0]  = np.minimum(q[:, 0], x)
+        q[:, -1] = np.maximum(q[:, -1], x)
+        below = np.sum(x[:, None] >= q[:, 1:-1], axis=1)
+        n    += np.arange(m)[None, :] > below[:, None]
+        want += self.probs
+
+        # nudge each middle marker by one position towards where it should
+        # be, along the parabola through it and its neighbours, or the line
+        # to the neighbour it moves towards when the parabola overshoots
+        rows = np.arange(len(x))
+        for i in range(1, m-1):
+            d    = want[:, i] - n[:, i]
+            move = ((d >= 1) & (n[:, i+1] - n[:, i] > 1)) | ((d <= -1) & (n[:, i-1] - n[:, i] < -1))
+            d    = np.sign(d) * move
+            j    = i + d.astype(np.int64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                parabolic = q[:, i] + d / (n[:, i+1] - n[:, i-1]) * (
+                    (n[:, i] - n[:, i-1] + d) * (q[:, i+1] - q[:, i]) / (n[:, i+1] - n[:, i]) +
+                    (n[:, i+1] - n[:, i] - d) * (q[:, i] - q[:, i-1]) / (n[:, i] - n[:, i-1]))
+                linear = q[:, i] + d * (q[rows, j] - q[:, i]) / (n[rows, j] - n[:, i])
+            inside   = (q[:, i-1] < parabolic) & (parabolic < q[:, i+1])
+            q[:, i]  = np.where(move, np.where(inside, parabolic, linear), q[:, i])
+            n[:, i] += d
+        self.heights[cells], self.pos[cells], self.desired[cells] = q, n, want
+
+    def estimate(self):
+        """the estimated quantile of every cell; NaN for cells with no values"""
+        out = self.heights[..., self.marker].copy()
+        few = self.count < self.exact
+        if few.any():
+            # cells with no values at all warn of an all-NaN slice
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                out[few] = np.nanpercentile(self.kept[few], 100 * self.p, axis=-1)
+        return out
+
+
+
+################################################################################
+# BOOTSTRAP
+################################################################################
+def bootstrap_scores(trials, methods, replicates=1000, groups=None, workers=None, seed=None,
+                     alpha=0.05, iters=100, dummy=True, engine="python", tol=None):
+    """Percentile bootstrap intervals. Parameters are:
+         trials     = trials as (best, worst, (others)), as for score_trials.
+         methods    = scoring methods to get intervals for.
+         groups     = optional participant id of each trial. If given, whole
+                      participants are resampled instead of single trials.
+         workers    = processes to score replicates in; default one per CPU.
+         seed       = master seed. Replicate i always gets the same stream.
+         alpha      = intervals cover the central 1-alpha of replicates.
+         iters, dummy, engine, tol are passed on to score_trials.
+
+       Returns {item: {method: (low, high)}}.
+    """
+    items = { }
+    for best, worst, others in trials:
+        for item in (best, worst) + others:
+            if item not in items:
+                items[item] = len(items)
+
+    participants = None
+    if groups is not None:
+        by_group = { }
+        for trial, group in zip(trials, groups):
+            by_group.setdefault(group, []).append(trial)
+        participants = list(by_group.values())
+
+    options = { "methods": list(methods), "items": items, "iters": iters, "dummy": dummy,
+                "engine": engine, "tol": tol }
+    streams = np.random.SeedSequence(seed).spawn(replicates)
+    workers = workers or os.cpu_count()
+
+    # each replicate is folded into the bound estimates as it arrives, in
+    # replicate order, and then dropped
+    lows  = QuantileSketch((len(items), len(methods)), alpha / 2)
+    highs = QuantileSketch((len(items), len(methods)), 1 - alpha / 2)
+    pool  = Pool(workers, initializer=init_worker, initargs=(trials, participants, options))
+    try:
+        for replicate in pool.imap(score_replicate, streams, chunksize=1):
+            lows.add(replicate)
+            highs.add(replicate)
+    finally:
+        pool.close()
+        pool.join()
+
+    low, high = lows.estimate(), highs.estimate()
+    intervals = { }
+    for item, i in items.items():
+        intervals[item] = dict((method, (float(low[i, j]), float(high[i, j])))
+                               for j, method in enumerate(methods))
+    return intervals
+
+
+
+################################################################################
+# MAIN
+################################################################################
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Bootstrap confidence intervals for best-worst scores.')
+    parser.add_argument("input", nargs="*", type=str, help="Path to a file(s) containing data to score.")
+    parser.add_argument("--sep", type=str, default=None, help="Specify the column separator. If None specified, use default (tab for .tsv, comma for all else)")
+    parser.add_argument("--name", type=str, default="Word", help="The name of the column we should use for outputting the item. Defaults to 'Word'.")
+    parser.add_argument("--best", type=str, default="best", help="Name of column that holds string of 'best' choice.")
+    parser.add_argument("--worst", type=str, default="worst", help="Name of column that holds string of 'worst' choice.")
+    parser.add_argument("--participant", type=str, default=None, help="Name of a column identifying participants (e.g. experimentID). If given, whole participants are resampled instead of single trials.")
+    parser.add_argument("--methods", type=str, default="ABW,Value", help="Comma-separated scoring methods.")
+    parser.add_argument("--replicates", type=int, default=1000, help="Number of bootstrap replicates.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Report the central 1-alpha percentile interval.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes to score replicates in. Defaults to one per CPU.")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed; the same seed gives the same intervals.")
+    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for.")
+    parser.add_argument("--tol", type=float, default=None, help="Stop tournament iterations early at this tolerance; see score_trials.py.")
+    parser.add_argument("--engine", type=str, default="python", help="Scoring engine: python, numpy or numba.")
+    args = parser.parse_args(argv)
+
+    trials, groups = [ ], [ ]
+    for file in args.input:
+        file_trials = scoring.parse_bestworst_data(file, bestCol=args.best, worstCol=args.worst, sep=args.sep)
+        trials += file_trials
+        if args.participant is not None:
+            sep = args.sep or ("\t" if file.endswith(".tsv") else ",")
+            groups += Spreadsheet.read_csv(file, delimiter=sep)[args.participant]
+
+    methods = args.methods.split(",")
+    intervals = bootstrap_scores(trials, methods, replicates=args.replicates,
+                                 groups=groups if args.participant is not None else None,
+                                 workers=args.workers, seed=args.seed, alpha=args.alpha,
+                                 iters=args.iters, engine=args.engine, tol=args.tol)
+
+    # print the header and results
+    header = [ args.name ] + [ "%s_%s" % (method, bound) for method in methods for bound in ("low", "high") ]
+    print(",".join(header))
+    for name, bounds in intervals.items():
+        out = [ name ] + [ v for method in methods for v in bounds[method] ]
+        print(",".join([ str(v) for v in out ]))
+
+if __name__ == "__main__":
+    sys.exit(main())
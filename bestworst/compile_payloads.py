@@ -0,0 +1,59 @@
+"""
+compile_payloads.py
+
+Precomputes what the backend's /api/start would otherwise build for every
+participant: for each slice of trials handed out by the slice allocator, the
+full trial objects (type name, best/worst question, and options with image
+URLs and titles) for every experiment type.
+
+Takes the design written by create_trials.py, the artwork catalog, and a JSON
+list of experiment types (the documents of the experiment_types collection),
+and writes a gzipped JSON file. Point the backend's PAYLOADS_PATH at it.
+
+Usage:
+  python compile_payloads.py all_trials_reduced.csv artwork_with_hm_entropy.csv types.json
+"""
+import sys, argparse, json, gzip
+import pandas as pd
+
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Precompile per-slice experiment payloads for the backend.')
+    parser.add_argument("trials", type=str, help="Design csv written by create_trials.py.")
+    parser.add_argument("artworks", type=str, help="Artwork catalog csv, with id, img and title columns.")
+    parser.add_argument("types", type=str, help="JSON file with a list of experiment types (name, best, worst).")
+    parser.add_argument("--slice_size", type=int, default=20, help="Trials per participant. Must match the backend's allocator.")
+    parser.add_argument("--out", type=str, default="payloads.json.gz", help="Where to write the compiled payloads.")
+
+    args = parser.parse_args()
+
+    design = pd.read_csv(args.trials)
+    design = design.drop(columns=[c for c in design.columns if str(c).startswith("Unnamed")])
+    artworks = pd.read_csv(args.artworks).set_index("id")
+    types = json.load(open(args.types))
+
+    # The backend hands out [start, start+slice_size), capped at the last
+    # usable row (the row count minus one)
+    last = design.shape[0] - 1
+    slices = { }
+    for start in range(0, last, args.slice_size):
+        end = min(start + args.slice_size, last)
+        trials = [ ]
+        for type in types:
+            for row in range(start, end):
+                options = [ ]
+                for o in design.iloc[row].tolist():
+                    artwork = artworks.loc[o]
+                    options.append({"option_id": int(o), "imageURL": artwork["img"], "title": artwork["title"]})
+                trials.append({"id": "%s-%d" % (type["name"], row), "name": type["name"],
+                               "best_question": type["best"], "worst_question": type["worst"],
+                               "options": options})
+        slices["%d-%d" % (start, end)] = trials
+
+    with gzip.open(args.out, "wt") as f:
+        json.dump({"slice_size": args.slice_size, "types": types, "slices": slices}, f)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,6 +26,7 @@ For published academic research using these tools, please cite:
 import sys, argparse, trialgen
 from spreadsheet import Spreadsheet
 import pandas as pd
+import numpy as np
 
 
 
@@ -37,6 +38,7 @@ def main(argv=sys.argv[1:]):
     parser.add_argument("--generator", type=str, default="norepeateven", help="Method for generating trials. Don't screw with unless you know what you are doing. Options are: random, even, norepeat, norepeateven.") 
     parser.add_argument("--column", type=str, default=None, help="If inputting a structured text file, indicate which column to pull data from.")
     parser.add_argument("--sep", type=str, default=None, help="Specify the column separator. If None specified, use default (tab for .tsv, comma for all else)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for trial generation; the same seed gives the same trials.")
 
     args = parser.parse_args()
     
@@ -70,13 +72,13 @@ def main(argv=sys.argv[1:]):
     # generate trials from items
     trials = [ ]
     if args.generator == "norepeateven":
-        trials = trialgen.build_trials_even_bigram_norepeat(items, N=N, K=K)
+        trials = trialgen.build_trials_even_bigram_norepeat(items, N=N, K=K, rng=args.seed)
     elif args.generator == 'even':
-        trials = trialgen.build_trials_even(items, N=N, K=K)
+        trials = trialgen.build_trials_even(items, N=N, K=K, rng=args.seed)
     elif args.generator == 'random':
-        trials = trialgen.build_trials_random(items, N=N, K=K)
+        trials = trialgen.build_trials_random(items, N=N, K=K, rng=args.seed)
     elif args.generator == "norepeat":
-        trials = trialgen.build_trials_random_bigram_norepeat(items, N=N, K=K)
+        trials = trialgen.build_trials_random_bigram_norepeat(items, N=N, K=K, rng=args.seed)
     else:
         raise Exception("You must specify a proper generation method: norepeateven, even, random, norepeat.")
 
@@ -88,6 +90,13 @@ def main(argv=sys.argv[1:]):
     # return trials
     df = pd.DataFrame(trials)
     df.to_csv("all_trials_reduced.csv")
+
+    # when items are numeric ids (e.g. artwork ids), also save the design as
+    # an int32 matrix the backend can memory-map (see TRIAL_DESIGN_PATH)
+    try:
+        np.save("all_trials_reduced.npy", np.asarray(trials, dtype=np.int32))
+    except ValueError:
+        pass
     
         
 if __name__ == "__main__":
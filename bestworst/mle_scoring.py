@@ -0,0 +1,200 @@
+"""
+mle_scoring.py
+
+Scoring methods fitted by maximum likelihood, as alternatives to the
+order-dependent tournament methods (Elo, Value, RW) in scoring.py:
+
+  BradleyTerry - Bradley-Terry strengths, fitted to the win counts of all
+                 (winner, loser) pairings in a sparse win matrix. Scores
+                 are log-strengths.
+  MaxDiff      - A best-worst (maxdiff) multinomial logit: best is chosen
+                 from the trial's options with probability proportional to
+                 exp(u), then worst from the remaining ones with probability
+                 proportional to exp(-u). Scores are the utilities u.
+
+Both are fitted by diagonal Newton steps, are deterministic and converge in
+a few dozen passes over the data, each of which is a handful of array
+operations. Steps are sized by the log-likelihood's curvature along them
+and halved until they raise it, so every fit climbs monotonically; a fit
+that runs out of iterations first warns and says so in its report. Use them through
+scoring.score_trials like any other method.
+"""
+import warnings
+import numpy as np
+
+# Pseudo-games every item plays against a virtual item of log-strength 0
+# (one win, one loss each). Keeps strengths finite for items that never won or
+# never lost, which the dummy players can't do for Bradley-Terry: their
+# perfect records have no finite maximum likelihood.
+BT_PRIOR = 1.0
+# Gaussian prior on maxdiff utilities (a ridge penalty), for the same reason
+MAXDIFF_PRIOR = 0.1
+# A move is kept once it gains at least this fraction of the log-likelihood
+# its slope promises (the Armijo condition); until then it is halved, down to
+# MIN_STEP_SCALE of a Newton step
+ARMIJO = 1e-4
+MIN_STEP_SCALE = 2.0 ** -30
+
+
+
+################################################################################
+# FITTING
+################################################################################
+def _climb(objective, x, step, current, slope, curvature):
+    """Moves x along step to where a quadratic model of the objective peaks,
+       given its slope (the gradient dotted with step) and curvature (minus
+       step.H.step) along step, and returns (x, objective there, how much of
+       step was taken). The diagonal Newton step alone ignores how items'
+       estimates pull on each other, so taking all of it overshoots when
+       they are strongly coupled, e.g. in bipartite designs where every item
+       only meets items of the other group. The move is halved until it
+       raises the objective by at least ARMIJO of what the slope promises.
+    """
+    scale = slope / curvature if curvature > 0 else 1.0
+    while True:
+        candidate = x + scale * step
+        value = objective(candidate)
+        if value >= current + ARMIJO * scale * slope or abs(scale) <= MIN_STEP_SCALE:
+            return candidate, value, scale
+        scale /= 2
+
+def _finish(name, iters, converged, report):
+    """Reports how a fit ended, warning when it ran out of iterations"""
+    if report is not None:
+        report["iterations"] = iters
+        report["converged"]  = bool(converged)
+    if not converged:
+        warnings.warn("%s fit did not converge in %d iterations" % (name, iters))
+
+
+
+################################################################################
+# BRADLEY-TERRY
+################################################################################
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _log_sigmoid(x):
+    return -np.logaddexp(0, -x)
+
+def bradley_terry_loglik(matrix, t, prior=BT_PRIOR):
+    """log-likelihood of log-strengths t, prior pseudo-games included"""
+    return (np.dot(matrix.counts, _log_sigmoid(t[matrix.rows] - t[matrix.cols])) +
+            prior * np.sum(_log_sigmoid(t) + _log_sigmoid(-t)))
+
+def fit_bradley_terry(matrix, prior=BT_PRIOR, tol=1e-4, max_iters=200, report=None):
+    """Fits Bradley-Terry log-strengths t to a scoring.WinMatrix, where i beats j
+       with probability sigmoid(t[i] - t[j]). Each step moves every t[i] by
+       its gradient over its diagonal Hessian entry, scaled by _climb so the
+       log-likelihood rises, followed by a Newton step of all t together.
+       That takes a few dozen steps on our designs; the classic MM update,
+       which is the same step with a cruder curvature bound, needed
+       hundreds. The prior's virtual opponent has log-strength 0. Returns t,
+       centred on 0; report gets "iterations" and "converged".
+    """
+    n = matrix.size
+    t = np.zeros(n)
+    wins = matrix.wins() + prior
+    loglik = bradley_terry_loglik(matrix, t, prior)
+    iters, converged = 0, n == 0
+    for iters in range(1, max_iters+1):
+        if converged:
+            break
+        # chance that the row player of each pairing beats the column player
+        s = _sigmoid(t[matrix.rows] - t[matrix.cols])
+        v = _sigmoid(t)
+        expected = (np.bincount(matrix.rows, weights=matrix.counts * s, minlength=n) +
+                    np.bincount(matrix.cols, weights=matrix.counts * (1 - s), minlength=n) +
+                    2 * prior * v)
+        var  = matrix.counts * s * (1 - s)
+        hess = (np.bincount(matrix.rows, weights=var, minlength=n) +
+                np.bincount(matrix.cols, weights=var, minlength=n) +
+                2 * prior * v * (1 - v))
+        objective = lambda x: bradley_terry_loglik(matrix, x, prior)
+        grad = wins - expected
+        step = grad / hess
+        curvature = (np.dot(var, (step[matrix.rows] - step[matrix.cols]) ** 2) +
+                     2 * prior * np.dot(v * (1 - v), step ** 2))
+        t, loglik, scale = _climb(objective, t, step, loglik, np.dot(grad, step), curvature)
+
+        # Only the prior pins down the strengths' common level, and weakly,
+        # so the steps above barely move it; a Newton step along it directly
+        v = _sigmoid(t)
+        slope = prior * np.sum(1 - 2 * v)
+        shift = slope / max(2 * prior * np.sum(v * (1 - v)), 1e-12)
+        # (shift is already the Newton step, so its curvature is slope * shift)
+        t, loglik, shift_scale = _climb(objective, t, np.full(n, shift), loglik, slope * shift,
+                                        slope * shift)
+        converged = max(np.max(np.abs(scale * step)), abs(shift_scale * shift)) < tol
+    _finish("Bradley-Terry", iters, converged, report)
+    return t - t.mean() if n else t
+
+
+
+################################################################################
+# MAXDIFF LOGIT
+################################################################################
+def _softmax(x):
+    x = x - x.max(axis=1, keepdims=True)
+    e = np.exp(x)
+    return e / e.sum(axis=1, keepdims=True)
+
+def _logsumexp(x):
+    top = x.max(axis=1)
+    return top + np.log(np.exp(x - top[:, None]).sum(axis=1))
+
+def maxdiff_loglik(trial_rows, u, prior=MAXDIFF_PRIOR):
+    """log-likelihood of utilities u, minus the ridge penalty"""
+    total = -0.5 * prior * np.dot(u, u)
+    for rows in trial_rows.values():
+        total += np.sum(u[rows[:, 0]] - _logsumexp(u[rows]))
+        total += np.sum(-u[rows[:, 1]] - _logsumexp(-u[rows[:, 1:]]))
+    return total
+
+def fit_maxdiff(trial_rows, size, prior=MAXDIFF_PRIOR, tol=1e-4, max_iters=200, report=None):
+    """Fits best-worst logit utilities to trials given as
+       scoring.compile_trial_rows arrays (best, worst, others per row).
+       Returns utilities, centred on 0; report gets "iterations" and
+       "converged".
+    """
+    u = np.zeros(size)
+    loglik = maxdiff_loglik(trial_rows, u, prior)
+    iters, converged = 0, size == 0
+    for iters in range(1, max_iters+1):
+        if converged:
+            break
+        grad = -prior * u
+        hess = np.full(size, prior)
+        # each choice's probabilities, for the curvature along the step
+        choices = [ ]
+        for rows in trial_rows.values():
+            # best: chosen from all options
+            pb = _softmax(u[rows])
+            grad += np.bincount(rows[:, 0], minlength=size)
+            grad -= np.bincount(rows.ravel(), weights=pb.ravel(), minlength=size)
+            hess += np.bincount(rows.ravel(), weights=(pb * (1 - pb)).ravel(), minlength=size)
+
+            # worst: chosen from the options left once best is taken
+            rest = rows[:, 1:]
+            pw = _softmax(-u[rest])
+            grad -= np.bincount(rest[:, 0], minlength=size)
+            grad += np.bincount(rest.ravel(), weights=pw.ravel(), minlength=size)
+            hess += np.bincount(rest.ravel(), weights=(pw * (1 - pw)).ravel(), minlength=size)
+            choices += [ (rows, pb), (rest, pw) ]
+
+        step = grad / hess
+        # a choice's log-probability curves along step by minus the
+        # variance of step over its options
+        curvature = prior * np.dot(step, step)
+        for options, p in choices:
+            d = step[options]
+            curvature += np.sum(np.sum(p * d * d, axis=1) - np.sum(p * d, axis=1) ** 2)
+        u, loglik, scale = _climb(lambda x: maxdiff_loglik(trial_rows, x, prior), u, step, loglik,
+                                  np.dot(grad, step), curvature)
+        # the likelihood doesn't change when every utility shifts by the same
+        # amount, and the prior is smallest at a mean of 0
+        u -= u.mean()
+        loglik = maxdiff_loglik(trial_rows, u, prior)
+        converged = np.max(np.abs(scale * step)) < tol
+    _finish("MaxDiff", iters, converged, report)
+    return u
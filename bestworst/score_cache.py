@@ -0,0 +1,190 @@
+"""
+score_cache.py
+
+A disk cache of scoring results, so rescoring the same trials is a lookup.
+Results are keyed by a hash of the trials and of everything else that
+changes the scores: methods, iters, dummy, engine, tol and seed. Each entry
+is one .npz file holding the per-item table of ItemEntry fields, so cached
+results come back as the same {item: ItemEntry} score_trials returns.
+
+When there is no entry for a set of trials but there is one for its first
+n trials (e.g. a response file that has since had rows appended), scoring
+continues from that entry's ratings with score_trials(start=...) instead
+of starting over. Those results differ from a run from scratch, so they are
+cached apart, under settings that also record the entry they started from.
+
+The least recently used entries are deleted once the cache grows past its
+size limit.
+
+Usage:
+  cache   = ScoreCache("~/.cache/bestworst")
+  results = cache.score_trials(trials, ["Value", "ABW"], seed=1)
+"""
+import os, glob, json, hashlib, tempfile
+import numpy as np
+import scoring
+
+# ItemEntry fields kept in the table, and those that are read back as ints
+FIELDS = [ field for field in scoring.ItemEntry.__slots__ if field != "entity" ]
+INT_FIELDS = set(["wins", "losses", "trials", "best", "worst", "unranked", "david"])
+DUMMIES = [ scoring.BEST_WINNER, scoring.WORST_LOSER ]
+
+# 256 MB
+MAX_BYTES = 256 * 1024 * 1024
+
+
+
+################################################################################
+# HASHING
+################################################################################
+def settings_key(methods, iters, dummy, engine, tol, seed):
+    """hash of everything but the trials that changes scoring results"""
+    settings = [ sorted(set(methods)), iters, bool(dummy), engine, tol, seed ]
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+def warm_settings_key(settings, prefix):
+    """settings key of results continued from the entry at path prefix"""
+    return hashlib.sha256((settings + os.path.basename(prefix)).encode("utf-8")).hexdigest()[:16]
+
+def hash_trial(digest, trial):
+    best, worst, others = trial
+    digest.update(repr((best, worst, tuple(others))).encode("utf-8"))
+    digest.update(b"\n")
+
+def trials_key(trials):
+    digest = hashlib.sha256()
+    for trial in trials:
+        hash_trial(digest, trial)
+    return digest.hexdigest()[:32]
+
+
+
+################################################################################
+# CLASSES
+################################################################################
+class ScoreCache(object):
+    """Scoring results stored in `directory`, as
+       <settings key>-<number of trials>-<trials key>.npz files; results
+       continued from an earlier entry have a warm_settings_key instead.
+       The total size of the files is kept under max_bytes.
+    """
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def path(self, settings, num_trials, key):
+        return os.path.join(self.directory, "%s-%d-%s.npz" % (settings, num_trials, key))
+
+    def score_trials(self, trials, methods, iters=100, dummy=True, engine="python", tol=None, seed=None,
+                     report=None):
+        """scoring.score_trials, with results cached. seed is passed on as
+           score_trials' rng; runs with seed=None are cached too, so the
+           first run's scores are the ones returned from then on. report, if
+           given, is filled as score_trials fills it.
+        """
+        settings = settings_key(methods, iters, dummy, engine, tol, seed)
+        key  = trials_key(trials)
+        path = self.path(settings, len(trials), key)
+        if os.path.exists(path):
+            # mark as recently used
+            os.utime(path, None)
+            return self.load(path, report)
+
+        # continue from the longest cached run on a prefix of these trials.
+        # Never saved under `settings`, so only runs from scratch are found
+        # there, and never used as a prefix themselves.
+        start = None
+        prefix = self.find_prefix(settings, trials)
+        if prefix is not None:
+            path = self.path(warm_settings_key(settings, prefix), len(trials), key)
+            if os.path.exists(path):
+                os.utime(path, None)
+                return self.load(path, report)
+            start = self.load(prefix)
+
+        run_report = { }
+        results = scoring.score_trials(trials, methods, iters=iters, dummy=dummy, engine=engine, tol=tol,
+                                       report=run_report, start=start, rng=seed)
+        self.save(path, results, run_report)
+        self.evict()
+        if report is not None:
+            report.update(run_report)
+        return results
+
+    def find_prefix(self, settings, trials):
+        """path of the entry with these settings for the most trials that
+           are a prefix of trials, or None
+        """
+        candidates = { }
+        for path in glob.glob(os.path.join(self.directory, settings + "-*.npz")):
+            num_trials, key = os.path.basename(path)[:-len(".npz")].split("-")[1:]
+            if 0 < int(num_trials) < len(trials):
+                candidates.setdefault(int(num_trials), set()).add(key)
+        if not candidates:
+            return None
+
+        # one pass over the trials, checking the hash at every cached length
+        digest, found = hashlib.sha256(), None
+        last = max(candidates)
+        for i, trial in enumerate(trials[:last]):
+            hash_trial(digest, trial)
+            if i+1 in candidates and digest.hexdigest()[:32] in candidates[i+1]:
+                found = self.path(settings, i+1, digest.hexdigest()[:32])
+        if found is not None:
+            os.utime(found, None)
+        return found
+
+    def save(self, path, results, report):
+        """writes the results as a table with a row per item, dummies last"""
+        items   = [ item for item in results if not isinstance(item, scoring.DummyPlayer) ]
+        dummies = [ dummy for dummy in DUMMIES if dummy in results ]
+        entries = [ results[item] for item in items + dummies ]
+        table   = np.array([ [ getattr(entry, field) for field in FIELDS ] for entry in entries ],
+                           dtype=np.float64).reshape(len(entries), len(FIELDS))
+
+        # write to a temporary file first, so readers never see half an entry
+        handle, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, items=np.array(items), table=table, dummies=len(dummies),
+                     iterations=report.get("iterations", 0), deltas=json.dumps(report.get("deltas", { })),
+                     converged=json.dumps(report.get("converged", { })))
+        os.replace(temp, path)
+
+    def load(self, path, report=None):
+        with np.load(path, allow_pickle=False) as data:
+            items   = data["items"].tolist() + DUMMIES[:int(data["dummies"])]
+            table   = data["table"]
+            if report is not None:
+                report["iterations"] = int(data["iterations"])
+                report["deltas"] = json.loads(str(data["deltas"]))
+                # entries saved before it was recorded
+                report["converged"] = json.loads(str(data["converged"])) if "converged" in data.files else { }
+
+        results = { }
+        for item, row in zip(items, table.tolist()):
+            entry = scoring.ItemEntry(item)
+            for field, value in zip(FIELDS, row):
+                setattr(entry, field, int(value) if field in INT_FIELDS else value)
+            results[item] = entry
+        return results
+
+    def evict(self):
+        """deletes the least recently used entries until under max_bytes"""
+        entries = [ ]
+        for path in glob.glob(os.path.join(self.directory, "*.npz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum([ size for _, size, _ in entries ])
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -28,7 +28,7 @@ For published academic research using these tools, please cite:
     with applications to crowdsourcing semantic judgments. Behavior Research 
     Methods, XX(X), 1-19. doi: 10.3758/s13428-017-0898-2
 """
-import sys, argparse, trialgen, math, scoring
+import sys, argparse, trialgen, math, scoring, score_cache
 from spreadsheet import Spreadsheet
 
 
@@ -44,8 +44,13 @@ def main(argv=sys.argv[1:]):
     parser.add_argument("--name", type=str, default="Word", help="The name of the column we should use for outputting the item. Defaults to 'Word'.")
     parser.add_argument("--best", type=str, default="best", help="Name of column that holds string of 'best' choice.")
     parser.add_argument("--worst", type=str, default="worst", help="Name of column that holds string of 'worst' choice.")
+    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for. 100 is likely sufficient to ensure convergence, if not a little overkill; with --tol, the most iterations to run.")
+    parser.add_argument("--tol", type=float, default=None, help="Stop updating each tournament score once it changes by less than this over an iteration (relative to its interquartile range), or once its changes stop shrinking, as Elo's do; e.g. 0.001. Iterations run, final changes and the iteration each score stopped at are reported on stderr.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the order tournament-based methods visit pairings in; the same seed gives the same scores.")
+    parser.add_argument("--cache", type=str, default=None, help="Directory to cache scores in, e.g. ~/.cache/bestworst. Rescoring the same trials with the same options is then a lookup, and trials that extend cached ones continue from their scores.")
+    parser.add_argument("--cache-mb", type=int, default=score_cache.MAX_BYTES // (1024*1024), help="Size limit of the cache; least recently used scores are deleted past it.")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # go over each supplied input file and collect data
     trials = [ ]
@@ -54,7 +59,15 @@ def main(argv=sys.argv[1:]):
         
     # perform scoring. This takes awhile.
     methods = ["Value","Elo","RW","Best","Worst","Unchosen","BestWorst","ABW","David","ValueLogit","RWLogit","BestWorstLogit"] # "EloLogit",
-    results = scoring.score_trials(trials, methods)
+    report  = { }
+    if args.cache is not None:
+        cache   = score_cache.ScoreCache(args.cache, max_bytes=args.cache_mb * 1024*1024)
+        results = cache.score_trials(trials, methods, iters=args.iters, tol=args.tol, seed=args.seed, report=report)
+    else:
+        results = scoring.score_trials(trials, methods, iters=args.iters, tol=args.tol, report=report, rng=args.seed)
+    if args.tol is not None:
+        sys.stderr.write("iterations: %d, final changes: %s, converged at: %s\n" %
+                         (report["iterations"], report["deltas"], report["converged"]))
 
     # start building table of scored values for each item
 
@@ -66,7 +79,7 @@ def main(argv=sys.argv[1:]):
     # print the header and results
     header = [ args.name ] + methods
     print(",".join(header))
-    for name, data in results.iteritems():
+    for name, data in results.items():
         # skip dummy items
         if type(name) != str:
             continue
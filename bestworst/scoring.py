@@ -16,7 +16,8 @@ For published academic research using these tools, please cite:
     with applications to crowdsourcing semantic judgments. Behavior Research 
     Methods, XX(X), 1-19. doi: 10.3758/s13428-017-0898-2
 """
-import random, math
+import math
+import numpy as np
 from spreadsheet import Spreadsheet
 
 
@@ -51,6 +52,67 @@ scoring_methods = {
     "EloLogit"     : lambda item,eloMax,eloMin: item.elo_logit_score(eloMin,eloMax),
     "ValueLogit"   : lambda item: item.value_logit_score(),
     "RWLogit"      : lambda item: item.reswag_logit_score(),
+
+    # Fitted models; see mle_scoring.py
+    "BradleyTerry" : lambda item: item.bradley_terry,
+    "MaxDiff"      : lambda item: item.maxdiff,
+    }
+
+# What each scoring method needs computed beyond the per-trial counts (best,
+# worst, trials, unranked), which are always done:
+#   tallies   = wins and losses over all pairings
+#   david     = the win matrix, for David scores
+#   elo, value, reswag = that error-correction rating
+#   bradley_terry, maxdiff = that fitted model (mle_scoring.py)
+method_requirements = {
+    "Best"           : (),
+    "Worst"          : (),
+    "Unchosen"       : (),
+    "Ties"           : (),
+    "ABW"            : (),
+    "BestWorst"      : ("tallies",),
+    "BestWorstLogit" : ("tallies",),
+    "Wins"           : ("tallies",),
+    "Losses"         : ("tallies",),
+    "WinLoss"        : ("tallies",),
+    "WinLossLogit"   : ("tallies",),
+    "David"          : ("tallies", "david"),
+    "Elo"            : ("elo",),
+    "EloLogit"       : ("elo",),
+    "Value"          : ("value",),
+    "ValueLogit"     : ("value",),
+    "RW"             : ("reswag",),
+    "RWLogit"        : ("reswag",),
+    "BradleyTerry"   : ("bradley_terry",),
+    "MaxDiff"        : ("maxdiff",),
+    }
+
+# The error-correction update behind each rating
+rating_updates = {
+    "elo"    : lambda winner, loser, iteration: winner.win_elo(loser, iteration),
+    "value"  : lambda winner, loser, iteration: winner.win_value_discrim(loser, iteration),
+    "reswag" : lambda winner, loser, iteration: winner.win_reswag(loser, iteration),
+    }
+RATINGS = ("elo", "value", "reswag")
+MODELS  = ("bradley_terry", "maxdiff")
+
+# Pairings converted from array indices to Python ints at a time while scoring
+PAIRING_BLOCK = 65536
+
+# The error-correction state an item carries over when scoring continues from
+# earlier ratings (score_trials(start=...)), and the iterations run then
+RATING_FIELDS = ("elo", "value", "reswag_win", "reswag_lose")
+WARM_PASSES   = 10
+
+# Iterations a rating's change may go without reaching a new low before the
+# rating counts as converged; see Convergence
+PATIENCE = 5
+
+# How each rating is read off an item when checking for convergence
+rating_scores = {
+    "elo"    : lambda item: item.elo,
+    "value"  : lambda item: item.value,
+    "reswag" : lambda item: item.reswag_score(),
     }
 
 
@@ -58,10 +120,29 @@ scoring_methods = {
 ################################################################################
 # CLASSES
 ################################################################################
+class DummyPlayer(object):
+    """The always-winning and always-losing players added to the pairings.
+       Not strings, so they are told apart from items like any other
+       non-item key; the same two are used by every scoring run, so their
+       entries can be carried over between runs.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "<%s>" % self.name
+
+BEST_WINNER = DummyPlayer("best_winner")
+WORST_LOSER = DummyPlayer("worst_loser")
+
 class ItemEntry(object):
     """Contains an entry for a single item in your best-worst experiment. Used
        for tracking wins, losses, and ratings for various scoring methods.
+       Slotted, so large designs don't pay for a __dict__ per item.
     """
+    __slots__ = ("entity", "elo", "wins", "losses", "trials", "best", "worst", "unranked",
+                 "value", "reswag_win", "reswag_lose", "bradley_terry", "maxdiff", "david")
+
     def __init__(self, entity, base=0):
         self.entity = entity
 
@@ -85,18 +166,19 @@ class ItemEntry(object):
         self.reswag_win  = 0.0
         self.reswag_lose = 0.0
 
-        # opponents beat and lost to
-        self.beat        = set()
-        self.lose        = set()
+        # for fitted models
+        self.bradley_terry = 0.0
+        self.maxdiff       = 0.0
+
+        # for david scoring; set for all items at once by tally_pairings,
+        # from the win matrix
+        self.david = 0
 
     def win(winner, loser, iteration=1):
         winner.win_elo(loser, iteration)
         winner.win_value_discrim(loser, iteration)
         winner.win_reswag(loser, iteration)
 
-        winner.beat.add(loser)
-        loser.lose.add(winner)
-
     def win_value_discrim(winner, loser, iteration):
         """Update Value Score based on win/loss
         """
@@ -164,11 +246,11 @@ class ItemEntry(object):
     # SCORING FUNCTIONS
     ############################################################################
     def david_unbalanced_score(self):
-        """Calculates the score proposed by H. David (1987)
+        """The score proposed by H. David (1987): the summed wins of the
+           opponents this item beat, minus the summed losses of the opponents
+           it lost to. Computed by tally_pairings.
         """
-        wsum = sum([opp.wins for opp in self.beat])
-        lsum = sum([opp.losses for opp in self.lose])
-        return wsum - lsum
+        return self.david
     
     def winloss_norm_score(self):
         # should range between [-1, 1]
@@ -304,78 +386,467 @@ def compile_pairings(trials):
             pairings.append((other,worst))
     return pairings
 
-def run_error_correction_scoring(item_data, pairings, iters=100):
+def compile_trial_rows(trials, index):
+    """Groups trials by their number of unchosen options. Returns {size:
+       rows}, where rows is an int32 array with one trial per row: the
+       indices (index[item]) of best, worst, then the unchosen options.
+    """
+    # flat lists of indices, best, worst, others..., per number of options
+    by_size = { }
+    for best, worst, others in trials:
+        flat = by_size.setdefault(len(others), [])
+        flat.append(index[best])
+        flat.append(index[worst])
+        flat.extend(map(index.__getitem__, others))
+    return dict((size, np.array(flat, dtype=np.int32).reshape(-1, size+2)) for size, flat in by_size.items())
+
+def compile_pairing_array(trial_rows):
+    """Like compile_pairings, but from compile_trial_rows' arrays, and
+       returns the pairings as a (2, pairings) int32 array: row 0 holds
+       winners and row 1 losers. Trials with the same number of options are
+       expanded together with array operations.
+    """
+    winners, losers = [ ], [ ]
+    for size, rows in trial_rows.items():
+        best, worst, others = rows[:, 0], rows[:, 1], rows[:, 2:].ravel()
+        winners += [ best, np.repeat(best, size), others ]
+        losers  += [ worst, others, np.repeat(worst, size) ]
+    if not winners:
+        return np.empty((2, 0), dtype=np.int32)
+    return np.vstack((np.concatenate(winners), np.concatenate(losers)))
+
+class Pairings(object):
+    """All (winner, loser) pairings of a set of trials, stored compactly: an
+       int32 array of shape (2, pairings) whose entries index into `items`.
+       The first `real` items are the trials' items; after them come the
+       two dummy players, if any. trial_rows keeps the trials themselves, as
+       compile_trial_rows makes them, for the methods fitted to whole trials.
+       Build it once with from_trials and pass it to
+       score_trials(pairings=...) to reuse it across scoring runs of the
+       same trials.
+    """
+    def __init__(self, items, array, real=None, trial_rows=None):
+        self.items = items
+        self.array = array
+        self.real  = len(items) if real is None else real
+        self.trial_rows = trial_rows
+
+    def __len__(self):
+        return self.array.shape[1]
+
+    @property
+    def winners(self):
+        return self.array[0]
+
+    @property
+    def losers(self):
+        return self.array[1]
+
+    @staticmethod
+    def from_trials(trials, dummy=True, items=None):
+        """items fixes the order of items; by default, order of appearance"""
+        if items is None:
+            items = [ ]
+            seen  = set()
+            for best, worst, others in trials:
+                for item in (best, worst) + others:
+                    if item not in seen:
+                        seen.add(item)
+                        items.append(item)
+        items = list(items)
+        index = dict((item, i) for i, item in enumerate(items))
+        trial_rows = compile_trial_rows(trials, index)
+        array = compile_pairing_array(trial_rows)
+        real  = len(items)
+
+        # if we have dummy players, add those as well. Also add pairings for
+        # each item and the two dummies.
+        if dummy == True:
+            best_winner, worst_loser = len(items), len(items)+1
+            items += [ BEST_WINNER, WORST_LOSER ]
+            everyone = np.arange(real, dtype=np.int32)
+            array = np.hstack((array,
+                               np.vstack((np.full(real, best_winner, dtype=np.int32), everyone)),
+                               np.vstack((everyone, np.full(real, worst_loser, dtype=np.int32)))))
+        return Pairings(items, array, real=real, trial_rows=trial_rows)
+
+    def extended(self, trials):
+        """These pairings plus those of more trials, laid out as from_trials
+           would lay them out for all the trials together. Only the new
+           trials are compiled; items they bring in go after the existing
+           ones, and the dummy players, if any, stay last.
+        """
+        dummy = len(self.items) > self.real
+        items = self.items[:self.real]
+        index = dict((item, i) for i, item in enumerate(items))
+        for best, worst, others in trials:
+            for item in (best, worst) + others:
+                if item not in index:
+                    index[item] = len(items)
+                    items.append(item)
+        new_rows = compile_trial_rows(trials, index)
+        trial_rows = dict(self.trial_rows or { })
+        for size, rows in new_rows.items():
+            trial_rows[size] = np.vstack((trial_rows[size], rows)) if size in trial_rows else rows
+
+        # the dummies' pairings are the last 2 * real, and are rebuilt for
+        # the new items
+        kept  = self.array[:, :len(self) - 2*self.real] if dummy else self.array
+        array = np.hstack((kept, compile_pairing_array(new_rows)))
+        real  = len(items)
+        if dummy:
+            best_winner, worst_loser = real, real+1
+            items += [ BEST_WINNER, WORST_LOSER ]
+            everyone = np.arange(real, dtype=np.int32)
+            array = np.hstack((array,
+                               np.vstack((np.full(real, best_winner, dtype=np.int32), everyone)),
+                               np.vstack((everyone, np.full(real, worst_loser, dtype=np.int32)))))
+        return Pairings(items, array, real=real, trial_rows=trial_rows)
+
+    @staticmethod
+    def from_list(pairings):
+        """From a list of (winner, loser) pairs, as compile_pairings makes"""
+        items, index = [ ], { }
+        for pairing in pairings:
+            for item in pairing:
+                if item not in index:
+                    index[item] = len(items)
+                    items.append(item)
+        array = np.array([ [index[w] for w, _ in pairings], [index[l] for _, l in pairings] ],
+                         dtype=np.int32).reshape(2, len(pairings))
+        return Pairings(items, array)
+
+class WinMatrix(object):
+    """Sparse item x item matrix of win counts, in coordinate form: item
+       rows[k] beat item cols[k] counts[k] times. Built once from the
+       pairings; products with vectors are np.bincount calls, so this needs
+       nothing beyond NumPy.
+    """
+    def __init__(self, size, rows, cols, counts):
+        self.size   = size
+        self.rows   = rows
+        self.cols   = cols
+        self.counts = counts
+
+    @staticmethod
+    def from_pairings(winners, losers, size):
+        keys = winners.astype(np.int64) * size + losers
+        keys, counts = np.unique(keys, return_counts=True)
+        return WinMatrix(size, (keys // size).astype(np.int32), (keys % size).astype(np.int32),
+                         counts.astype(np.float64))
+
+    def dot(self, x, binary=False):
+        """(W @ x)[i] = sum over opponents j beaten by i of W[i,j] * x[j].
+           binary counts each beaten opponent once, however often.
+        """
+        weights = 1.0 if binary else self.counts
+        return np.bincount(self.rows, weights=weights * x[self.cols], minlength=self.size)
+
+    def tdot(self, x, binary=False):
+        """(W.T @ x)[i] = sum over opponents j that beat i of W[j,i] * x[j]"""
+        weights = 1.0 if binary else self.counts
+        return np.bincount(self.cols, weights=weights * x[self.rows], minlength=self.size)
+
+    def wins(self):
+        return np.bincount(self.rows, weights=self.counts, minlength=self.size)
+
+    def losses(self):
+        return np.bincount(self.cols, weights=self.counts, minlength=self.size)
+
+def tally_pairings(item_data, pairings, iters, david=True):
+    """Sets every item's wins and losses as ItemEntry.win tallies them, once
+       per pairing per iteration, and its David score: the summed wins of
+       the opponents it beat minus the summed losses of the opponents it
+       lost to. Both come from one sparse win matrix of the pairings.
+    """
+    matrix = WinMatrix.from_pairings(pairings.winners, pairings.losers, len(pairings.items))
+    wins   = matrix.wins() * iters
+    losses = matrix.losses() * iters
+    scores = matrix.dot(wins, binary=True) - matrix.tdot(losses, binary=True) if david else None
+    for i, item in enumerate(pairings.items):
+        entry = item_data[item]
+        entry.wins   = int(wins[i])
+        entry.losses = int(losses[i])
+        if david:
+            entry.david = int(scores[i])
+
+def plan_scoring(methods):
+    """Works out what has to be computed for the requested scoring methods.
+       Returns (tallies, david, ratings, models): whether win/loss tallies
+       and David scores are needed, and the tuples of
+       error-correction ratings to run and models to fit. No methods means
+       all of them.
+    """
+    if not methods:
+        methods = method_requirements.keys()
+    needs = set()
+    for method in methods:
+        if method not in method_requirements:
+            raise Exception("Unknown scoring method %s." % method)
+        needs.update(method_requirements[method])
+    ratings = tuple(r for r in RATINGS if r in needs)
+    models  = tuple(m for m in MODELS if m in needs)
+    return "tallies" in needs, "david" in needs, ratings, models
+
+def spread(values):
+    """interquartile range of values; unlike the sd, barely moved by the two
+       dummy players' extreme ratings
+    """
+    values = sorted(values)
+    n = len(values)
+    if n < 2:
+        return 0.0
+    return values[(3*n)//4] - values[n//4]
+
+def relative_change(previous, current):
+    """mean absolute change between two lists of ratings, relative to the
+       spread of the current ratings. Scale-free, so one tolerance works for
+       Elo points as well as for Value and RW weights.
+    """
+    if not current:
+        return 0.0
+    change = sum(abs(a - b) for a, b in zip(previous, current)) / float(len(current))
+    return change / max(spread(current), 1e-12)
+
+class Convergence(object):
+    """Decides after each iteration which ratings are still worth updating.
+       A rating has converged once its relative_change over an iteration is
+       below tol, or once that change has gone PATIENCE iterations without
+       reaching a new low. The second is what stops Elo: its fixed step
+       keeps every rating moving by about the same amount for good, so from
+       then on more iterations only reshuffle it. With tol=None the changes
+       are only recorded.
+    """
+    def __init__(self, ratings, tol):
+        self.active     = list(ratings)
+        self.tol        = tol
+        self.deltas     = { }
+        self.converged  = { }
+        self.lowest     = { }
+        self.stalled    = dict((r, 0) for r in ratings)
+        self.iterations = 0
+
+    def update(self, iteration, changes):
+        """records the changes of the active ratings over this iteration, as
+           {rating: relative change}, and returns the ratings still active
+        """
+        self.iterations = iteration
+        for r, change in changes.items():
+            self.deltas[r] = change
+            if change < self.lowest.get(r, float("inf")):
+                self.lowest[r], self.stalled[r] = change, 0
+            else:
+                self.stalled[r] += 1
+            if self.tol is not None and (change < self.tol or self.stalled[r] >= PATIENCE):
+                self.active.remove(r)
+                self.converged[r] = iteration
+        return self.active
+
+    def fill_report(self, report):
+        if report is not None:
+            report["iterations"] = self.iterations
+            report["deltas"]     = self.deltas
+            report["converged"]  = self.converged
+
+def make_rng(rng=None):
+    """The NumPy RNG scoring shuffles pairings with: rng itself if it is a
+       Generator (or RandomState), a new Generator if it is a seed or a
+       SeedSequence, and NumPy's global RNG for None.
+    """
+    if rng is None:
+        return np.random
+    if isinstance(rng, (int, np.integer, np.random.SeedSequence)):
+        return np.random.default_rng(rng)
+    return rng
+
+def run_error_correction_scoring(item_data, pairings, iters=100, ratings=None, tol=None, report=None, rng=None):
     """run our various error-correction scoring methods on entries in item_data
-       according to the (winner, loser) pairings supplied. Makes changes to
-       item_data in place, and returns the results as well.
+       according to the (winner, loser) pairings supplied, as a Pairings or a
+       list of pairs. Makes changes to item_data in place, and returns the
+       results as well.
+
+       ratings = which of "elo", "value" and "reswag" to update. None updates
+                 all of them and also sets the win/loss tallies and David
+                 scores, for the iterations that were run.
+       tol     = stop updating each rating once it has converged, as
+                 Convergence decides from its relative_change over an
+                 iteration, and stop before `iters` once all have. None
+                 always runs all `iters` iterations.
+       report  = optional dict; filled with the number of iterations run,
+                 the last measured change of each rating and, with tol, the
+                 iteration each rating converged at.
+       rng     = what pairing orders are drawn from; see make_rng.
     """
+    rng = make_rng(rng)
+    full = ratings is None
+    if full:
+        ratings = RATINGS
+    if not ratings:
+        Convergence(ratings, tol).fill_report(report)
+        return item_data
+    if not isinstance(pairings, Pairings):
+        pairings = Pairings.from_list(pairings)
+    players = [ item_data[item] for item in pairings.items ]
+    entries = list(item_data.values())
+    previous = dict((r, [ rating_scores[r](e) for e in entries ]) for r in ratings)
+    convergence = Convergence(ratings, tol)
+    active = list(ratings)
+
     # repeat iter number of times
     for i in range(iters):
-        # shuffle our data to eliminate order effects
-        random.shuffle(pairings)
+        # ItemEntry.win updates every rating in one call
+        updates = None
+        if not full or len(active) < len(RATINGS):
+            updates = [ rating_updates[r] for r in active ]
+
+        # visit the pairings in a new random order to eliminate order effects
+        order = rng.permutation(len(pairings))
+
+        # register a pairing in the item data. Indices are turned into Python
+        # ints a block at a time, so no full-size list is ever built.
+        for start in range(0, len(order), PAIRING_BLOCK):
+            block   = order[start:start+PAIRING_BLOCK]
+            winners = pairings.winners[block].tolist()
+            losers  = pairings.losers[block].tolist()
+            for winner,loser in zip(winners, losers):
+                winner_data, loser_data = players[winner], players[loser]
+                if updates is None:
+                    winner_data.win(loser_data, iteration=(i+1))
+                else:
+                    for update in updates:
+                        update(winner_data, loser_data, i+1)
+
+        # measure how far each rating still being updated moved
+        if tol is not None or report is not None:
+            changes = { }
+            for r in active:
+                current = [ rating_scores[r](e) for e in entries ]
+                changes[r] = relative_change(previous[r], current)
+                previous[r] = current
+            active = convergence.update(i+1, changes)
+            if not active:
+                break
+        else:
+            convergence.iterations = i+1
 
-        # register a pairing in the item data
-        for winner,loser in pairings:
-            winner_data, loser_data = item_data[winner], item_data[loser]
-            winner_data.win(loser_data, iteration=(i+1))
+    convergence.fill_report(report)
+    if full:
+        tally_pairings(item_data, pairings, convergence.iterations)
 
     # values were updated in-place; return original data structure
     return item_data
 
-def score_trials(trials, methods, iters=100, dummy=True):
+def score_trials(trials, methods, iters=100, dummy=True, engine="python", tol=None, report=None, pairings=None,
+                 start=None, rng=None):
     """The wrapper function for scoring trials. Parameters are:
          iters   = for error-correction methods (elo, Value, RescorlaWagner),the
                    number of iterations over the data to perform when scoring.
+                   With tol, the most iterations to perform.
+         tol     = Stop updating each error-correction rating once it changes
+                   by less than this over an iteration (mean absolute change
+                   relative to the ratings' interquartile range), or once its
+                   change stops shrinking, as Elo's does; see Convergence.
+                   0.001 stops all three well before 100 iterations with the
+                   same results. None always runs all iters.
+         report  = Optional dict, filled with "iterations" (how many were
+                   run), "deltas" (each rating's last measured change) and
+                   "converged" (the iteration each rating stopped at, with
+                   tol).
          dummy   = Whether always-win and always-lose dummy players should be
                    added to keep items in a bounded range for error-correction
                    methods. Highly suggested.
-         methods = The different scoring methods to apply.
+         methods = The different scoring methods to apply. Only the work these
+                   need is done; e.g. Best, Worst, Unchosen and ABW take a
+                   single pass over the trials. Other methods' scores on the
+                   returned items are not meaningful.
+         engine  = How error-correction methods are run: "python" (ItemEntry
+                   updates, one pairing at a time), "numpy" (chunked array
+                   updates, much faster, statistically equivalent) or "numba"
+                   (compiled sequential updates; requires numba). See
+                   array_scoring.py.
+         pairings = Optional Pairings.from_trials(trials, dummy) from an
+                   earlier run on the same trials, to skip rebuilding it.
+                   dummy is then taken from how it was built.
+         start   = Optional {item: ItemEntry} from an earlier run, e.g. on a
+                   subset of these trials (see score_cache.py). Error-
+                   correction ratings continue from its entries, and only
+                   WARM_PASSES iterations (at most iters) are run.
+         rng     = Seed or numpy.random.Generator that the order of pairings
+                   is drawn from, for reproducible runs; see make_rng. None
+                   uses NumPy's global RNG. Give each thread or process its
+                   own, e.g. from numpy.random.SeedSequence(seed).spawn(n).
     """
-    # first, extract out all of our unique items
-    items = set()
-    for trial in trials:
-        best, worst, others = trial
-        items.add(best)
-        items.add(worst)
-        for other in others:
-            items.add(other)
+    tallies, david, ratings, models = plan_scoring(methods)
 
-    # create data for each item
+    # create data for each item as it turns up, and calculate scores from
+    # count-based methods in the same pass
     item_data = { }
-    for item in items:
-        item_data[item] = ItemEntry(item)
-
-    # calculate scores from count-based methods 
     for trial in trials:
         winner, loser, others      = trial
-        item_data[winner].best    += 1
-        item_data[loser].worst    += 1
         for item in (winner, loser) + others:
+            if item not in item_data:
+                item_data[item] = ItemEntry(item)
             item_data[item].trials += 1
+        item_data[winner].best    += 1
+        item_data[loser].worst    += 1
         # track how many unranked MATCHES (not TRIALS) we had, used for
         # PAIRINGS methods
         for item in others:
             item_data[item].unranked += len(others)-1
+    items = list(item_data.keys())
+
+    # count-based methods need nothing else
+    if not (tallies or david or ratings or models):
+        Convergence((), tol).fill_report(report)
+        return item_data
 
     # now that count-based methods are done, use error-correction methods for
     # scoring. We need to reformat trials into a series of pairings where we
     # know winners and losers, and then calculate scores based on match wins
     # and losses. See Hollis (2017; reference in file header) for details.
         
-    # generate pairings from trials
-    pairings = compile_pairings(trials)
-        
-    # if we have dummy players, add those as well. Also add pairings for each
-    # item and the two dummies.
-    if dummy == True:
-        BEST_WINNER = object()
-        WORST_LOSER = object()
-        item_data[BEST_WINNER] = ItemEntry(BEST_WINNER)
-        item_data[WORST_LOSER] = ItemEntry(WORST_LOSER)
-        for item in items:
-            pairings.append([BEST_WINNER, item])
-            pairings.append([item, WORST_LOSER])
-
-    # apply our various error-correction scoring methods
-    item_data = run_error_correction_scoring(item_data, pairings, iters=iters)
+    # generate pairings from trials, plus the dummy players' pairings
+    if pairings is None:
+        pairings = Pairings.from_trials(trials, dummy=dummy, items=items)
+    for item in pairings.items:
+        if item not in item_data:
+            item_data[item] = ItemEntry(item)
+
+    # continue from earlier ratings, if we have them
+    passes = iters
+    if start is not None:
+        passes = min(iters, WARM_PASSES)
+        for item in pairings.items:
+            if item in start:
+                for field in RATING_FIELDS:
+                    setattr(item_data[item], field, getattr(start[item], field))
+
+    # apply only the error-correction scoring methods that were asked for
+    if engine == "python":
+        item_data = run_error_correction_scoring(item_data, pairings, iters=passes, ratings=ratings,
+                                                 tol=tol, report=report, rng=rng)
+    elif engine in ("numpy", "numba"):
+        import array_scoring
+        item_data = array_scoring.run_error_correction_scoring(item_data, pairings, iters=passes, engine=engine,
+                                                               ratings=ratings, tol=tol, report=report, rng=rng)
+    else:
+        raise Exception("Unknown scoring engine %s; use python, numpy or numba." % engine)
+
+    # Set after the ratings, since win_elo also adds to the tallies. Always
+    # for all iters, so stopping early with tol doesn't change them.
+    if tallies or david:
+        tally_pairings(item_data, pairings, iters, david=david)
+
+    # fitted models only look at the real items, not the dummy players
+    if models:
+        import mle_scoring
+        real = pairings.real
+        if "bradley_terry" in models:
+            keep   = (pairings.winners < real) & (pairings.losers < real)
+            matrix = WinMatrix.from_pairings(pairings.winners[keep], pairings.losers[keep], real)
+            for item, score in zip(pairings.items, mle_scoring.fit_bradley_terry(matrix).tolist()):
+                item_data[item].bradley_terry = score
+        if "maxdiff" in models:
+            for item, score in zip(pairings.items, mle_scoring.fit_maxdiff(pairings.trial_rows, real).tolist()):
+                item_data[item].maxdiff = score
     return item_data
@@ -15,6 +15,7 @@ For published academic research using these tools, please cite:
     Methods, XX(X), 1-19. doi: 10.3758/s13428-017-0898-2
 """
 import sys, argparse, scoring, trialgen, random
+import numpy as np
 from spreadsheet import Spreadsheet
 
 
@@ -22,19 +23,20 @@ from spreadsheet import Spreadsheet
 ################################################################################
 # HELPER FUNCTIONS
 ################################################################################
-def sort_words(trial, latent_values, noise=0):
+def sort_words(trial, latent_values, noise=0, rng=None):
     """Returns a sorted list of the words in trial (not in place), by their
-       latent value, plus added noise.
+       latent value, plus added noise drawn from rng (see trialgen.make_rng).
     """
+    rng = trialgen.make_rng(rng)
     trial = [ item for item in trial ]
     if noise == 0:
-        trial.sort(lambda a,b: cmp(latent_values[a], latent_values[b]), reverse=True)
+        trial.sort(key=lambda item: latent_values[item], reverse=True)
         return trial
     
     tmpvals = { }
     for item in trial:
-        tmpvals[item] = latent_values[item] + random.gauss(0,noise)
-    trial.sort(lambda a,b: cmp(tmpvals[a], tmpvals[b]), reverse=True)
+        tmpvals[item] = latent_values[item] + rng.gauss(0,noise)
+    trial.sort(key=lambda item: tmpvals[item], reverse=True)
     return trial
 
 
@@ -53,9 +55,11 @@ def main(argv=sys.argv[1:]):
     parser.add_argument("--item", type=str, default="Item", help="Column corresponding to item name.")
     parser.add_argument("--latentvalue", type=str, default="LatentValue", help="Column corresponding to latent value name.")
     parser.add_argument("--dummy", type=bool, default=True, help="use a dummy player to bound tournament-based scores.")
-    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for. 100 is likely sufficient to ensure convergence, if not a little overkill.")
+    parser.add_argument("--iters", type=int, default=100, help="Number of iterations to run tournament-based methods for. 100 is likely sufficient to ensure convergence, if not a little overkill; with --tol, the most iterations to run.")
+    parser.add_argument("--tol", type=float, default=None, help="Stop iterating once no tournament score changes by more than this over an iteration (relative to its interquartile range), e.g. 0.001. Iterations run and final changes are reported on stderr.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for trial generation, decision noise and scoring; the same seed gives the same results.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # determine the column seperator for our input data
     sep = args.sep
@@ -71,47 +75,57 @@ def main(argv=sys.argv[1:]):
         latent_values[str(row[args.item])] = row[args.latentvalue]
 
     # get the names of our unique items
-    items = latent_values.keys()
+    items = list(latent_values.keys())
 
     # parse our N and K
     K = args.K
     N = args.N
 
+    # independent streams for trial generation, decision noise and scoring,
+    # all derived from the one seed
+    trial_stream, noise_stream, score_stream = np.random.SeedSequence(args.seed).spawn(3)
+    trial_rng = random.Random(int(trial_stream.generate_state(1)[0]))
+    noise_rng = random.Random(int(noise_stream.generate_state(1)[0]))
+
     # generate trials from items
     trials = [ ]
     if args.generator == "norepeateven":
-        trials = trialgen.build_trials_even_bigram_norepeat(items, N=N, K=K)
+        trials = trialgen.build_trials_even_bigram_norepeat(items, N=N, K=K, rng=trial_rng)
     elif args.generator == 'even':
-        trials = trialgen.build_trials_even(items, N=N, K=K)
+        trials = trialgen.build_trials_even(items, N=N, K=K, rng=trial_rng)
     elif args.generator == 'random':
-        trials = trialgen.build_trials_random(items, N=N, K=K)
+        trials = trialgen.build_trials_random(items, N=N, K=K, rng=trial_rng)
     elif args.generator == "norepeat":
-        trials = trialgen.build_trials_random_bigram_norepeat(items, N=N, K=K)
+        trials = trialgen.build_trials_random_bigram_norepeat(items, N=N, K=K, rng=trial_rng)
     else:
         raise Exception("You must specify a proper generation method: norepeateven, even, random, norepeat.")
 
     
     # sort words in each trial by their latent value, plus noise
-    trials = [ sort_words(trial, latent_values, args.noise) for trial in trials ]
+    trials = [ sort_words(trial, latent_values, args.noise, rng=noise_rng) for trial in trials ]
     
     # convert the trials into format: (best, worst, (others,))
     trials = [ (trial[0], trial[-1], tuple(trial[1:-1])) for trial in trials ]
 
     # perform scoring. This takes awhile.
     methods = ["Value","Elo","RW","Best","Worst","Unchosen","BestWorst","ABW","David","ValueLogit","RWLogit","BestWorstLogit"]
-    results = scoring.score_trials(trials, methods, iters=args.iters, dummy=args.dummy)
+    report  = { }
+    results = scoring.score_trials(trials, methods, iters=args.iters, dummy=args.dummy, tol=args.tol, report=report,
+                                   rng=score_stream)
+    if args.tol is not None:
+        sys.stderr.write("iterations: %d, final changes: %s\n" % (report["iterations"], report["deltas"]))
 
     # print the header and results
     header = [ args.item, args.latentvalue ] + methods
-    print ",".join(header)
-    for name, data in results.iteritems():
+    print(",".join(header))
+    for name, data in results.items():
         # skip dummy items
         if type(name) != str:
             continue
         
         scores = [ scoring.scoring_methods[method](data) for method in methods ]
         out    = [ name, latent_values[name] ] + [ str(score) for score in scores ]
-        print ",".join([ str(v) for v in out ])
+        print(",".join([ str(v) for v in out ]))
 
 if __name__ == "__main__":
     sys.exit(main())
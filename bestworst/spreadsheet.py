@@ -35,7 +35,7 @@ class Spreadsheet(object):
     def __init__(self, header, rows):
         self.header = [h for h in header]
         self.colmap = { }
-        for i in xrange(len(self.header)):
+        for i in range(len(self.header)):
             self.colmap[self.header[i]] = i
         self.rows   = [SpreadsheetRow(self.colmap, r) for r in rows]
 
@@ -15,12 +15,26 @@ For published academic research using these tools, please cite:
   Hollis, G. (2017). Scoring best/worst data in unbalanced, many-item designs,
     with applications to crowdsourcing semantic judgments. Behavior Research 
     Methods, XX(X), 1-19. doi: 10.3758/s13428-017-0898-2
+
+Every generator takes an optional rng: a random.Random, or a seed for one.
+Without it, the random module's global RNG is used.
 """
 import random
 import itertools
 
 
-def build_trials_even_bigram_norepeat(items, N=1, K=4):
+def make_rng(rng=None):
+    """rng itself, a random.Random seeded with it if it is a seed, or the
+       random module for None.
+    """
+    if rng is None:
+        return random
+    if isinstance(rng, int):
+        return random.Random(rng)
+    return rng
+
+
+def build_trials_even_bigram_norepeat(items, N=1, K=4, rng=None):
     """Builds N trials with K items each.
 
        ensures any 2 pairs of items do not repeat, and that each item appears
@@ -30,6 +44,7 @@ def build_trials_even_bigram_norepeat(items, N=1, K=4):
        dataset (10k+ items). Then, reduce the restriction of repeating bigrams
        for computational efficiency and run build_trials_even.
     """
+    rng = make_rng(rng)
     items_orig = [w for w in items]
     if (N * K) % len(items) != 0:
         raise Exception(
@@ -41,7 +56,7 @@ def build_trials_even_bigram_norepeat(items, N=1, K=4):
 
     for i in range(batches):
         items = [w for w in items_orig]
-        random.shuffle(items)
+        rng.shuffle(items)
 
         fails = 0
         while len(items) > 0:
@@ -56,16 +71,17 @@ def build_trials_even_bigram_norepeat(items, N=1, K=4):
                 items = items[K:]
                 fails = 0
             else:
-                random.shuffle(items)
+                rng.shuffle(items)
                 fails += 1
     return trials
 
 
-def build_trials_even(items, N=1, K=4):
+def build_trials_even(items, N=1, K=4, rng=None):
     """Builds N trials with K items each.
 
        Ensures each item appears an equal number of times.
     """
+    rng = make_rng(rng)
     if (N * K) % len(items) != 0:
         raise Exception("For an even design, trials * K % items must equal 0.")
     trials_per_batch = len(items) / K
@@ -73,36 +89,38 @@ def build_trials_even(items, N=1, K=4):
     trials = []
     for i in range(batches):
         items_copy = [w for w in items]
-        random.shuffle(items_copy)
+        rng.shuffle(items_copy)
         while len(items_copy) > 0:
             trials.append(items_copy[:K])
             items_copy = items_copy[K:]
     return trials
 
 
-def build_trials_random(items, N=1, K=4):
+def build_trials_random(items, N=1, K=4, rng=None):
     """Builds N trials with K items each.
 
        Items are randomly pulled for each trial.
     """
+    rng = make_rng(rng)
     trials = []
     for i in range(N):
-        trials.append(random.sample(items, K))
+        trials.append(rng.sample(items, K))
     return trials
 
 
-def build_trials_random_bigram_norepeat(items, N=1, K=4):
+def build_trials_random_bigram_norepeat(items, N=1, K=4, rng=None):
     """Builds N trials with K items each.
 
        ensures any 2 pairs of items do not repeat, but items are randomly
        selected with no guarantee of an even number of appearances of each
        item. 
     """
+    rng = make_rng(rng)
     pairs = set()
 
     trials = []
     while len(trials) < N:
-        sample = tuple(random.sample(items, K))
+        sample = tuple(rng.sample(items, K))
 
         # build the pairlist
         combos = [c for c in itertools.combinations(sample, 2)]
@@ -115,11 +133,12 @@ def build_trials_random_bigram_norepeat(items, N=1, K=4):
     return trials
 
 
-def build_trials_semirandom(items, N=1, K=4, even_pct=0.5):
+def build_trials_semirandom(items, N=1, K=4, even_pct=0.5, rng=None):
     """forces some number of batches to be evenly distributed, but everything
     else is random.
     """
+    rng = make_rng(rng)
     trials_per_batch = len(items) / K
-    t_even = build_trials_even(items, int(N * even_pct), K)
-    t_random = build_trials_random(items, int(N*(1.0 - even_pct)), K)
+    t_even = build_trials_even(items, int(N * even_pct), K, rng=rng)
+    t_random = build_trials_random(items, int(N*(1.0 - even_pct)), K, rng=rng)
     return t_even + t_random
@@ -0,0 +1,104 @@
+import io
+import os
+import threading
+import time
+
+import requests
+
+ARTWORK_CSV_URL = 'https://firebasestorage.googleapis.com/v0/b/thelettersproject.appspot.com/o/artwork_with_hm_entropy.csv?alt=media&token=e3822a2a-8af8-433f-b840-e1edd4a1ece3'
+
+
+def _key(option_id):
+    """ Normalize an artwork id so that 12, 12.0, "12" and numpy ints all hit the same entry """
+    try:
+        return int(option_id)
+    except (TypeError, ValueError):
+        return str(option_id)
+
+
+class ArtworkCatalog:
+    """
+    Process-wide, read-only view of the artwork catalog.
+
+    The csv is downloaded once and indexed by artwork id, so resolving an
+    option to its image and title is a dict lookup. A daemon thread re-checks
+    the csv every `ttl` seconds and only re-parses it when the ETag changed.
+    The index is swapped in as a whole, so readers never need the lock.
+    Setting ARTWORK_CSV_PATH reads a local copy instead (re-read when its
+    mtime changes).
+    """
+
+    def __init__(self, url=ARTWORK_CSV_URL, ttl=600, path=None):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.etag = None
+        self.loaded_at = None
+        self._index = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def ensure_loaded(self):
+        if (not self._index):
+            with self._lock:
+                if (not self._index):
+                    self.refresh()
+        self.start_background_refresh()
+
+    def refresh(self):
+        """ Re-download the catalog if it changed. Returns True when the index was replaced. """
+        # Only parsing the csv needs pandas, and that happens on the first
+        # request or in the refresher thread, never at import
+        import pandas as pd
+        if (self.path):
+            etag = str(os.path.getmtime(self.path))
+            if (etag == self.etag):
+                self.loaded_at = time.time()
+                return False
+            tdf = pd.read_csv(self.path)
+        else:
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            res = requests.get(self.url, headers=headers, timeout=30)
+            if (res.status_code == 304):
+                self.loaded_at = time.time()
+                return False
+            res.raise_for_status()
+            tdf = pd.read_csv(io.StringIO(res.text))
+            etag = res.headers.get("ETag")
+        self._index = {_key(row.id): {"imageURL": row.img, "title": row.title}
+                       for row in tdf[["id", "img", "title"]].itertuples(index=False)}
+        self.etag = etag
+        self.loaded_at = time.time()
+        return True
+
+    def start_background_refresh(self):
+        if (self._refresher):
+            return
+        with self._lock:
+            if (self._refresher):
+                return
+            self._refresher = threading.Thread(
+                target=self.__refresh_forever, name="artwork-catalog-refresh", daemon=True)
+            self._refresher.start()
+
+    def __refresh_forever(self):
+        while True:
+            time.sleep(self.ttl)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last good copy
+                print("Artwork catalog refresh failed:", e)
+
+    def get_option(self, option_id):
+        """ Returns {option_id, imageURL, title} for an artwork, or None if it is not in the catalog """
+        artwork = self._index.get(_key(option_id))
+        if (artwork is None):
+            return None
+        return {"option_id": option_id, "imageURL": artwork["imageURL"], "title": artwork["title"]}
+
+
+artwork_catalog = ArtworkCatalog(path=os.environ.get('ARTWORK_CSV_PATH'))
@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# ARTRATER_CONCURRENT_IO=0 runs every step inline and in order, which is
+# easier to follow when debugging
+CONCURRENT_IO = os.environ.get('ARTRATER_CONCURRENT_IO', '1') != '0'
+
+# Shared by all request threads, so independent Firestore/Storage calls can
+# overlap without spawning threads per request. Work submitted here must not
+# wait on other work submitted here.
+io_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ARTRATER_IO_THREADS', 32)), thread_name_prefix="artrater-io")
+
+
+def submit(fn, *args, **kwargs):
+    """ Start fn on the I/O pool (or run it right away if concurrent I/O is off). Always returns a future. """
+    if (CONCURRENT_IO):
+        return io_pool.submit(fn, *args, **kwargs)
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -1,12 +1,33 @@
-from admin import experiment_type_ref, experiment_ref, db
-from firebase_admin import firestore
-import pandas as pd
+from catalog import artwork_catalog
+from trial_store import trial_design
+from types_cache import experiment_types
+from storage import storage, encode_response_log
+from concurrency import submit
+from payloads import compiled_payloads
+from metrics import stage, timed
 from flask import abort
 import datetime
 
 
+class ExperimentSnapshot:
+    """
+    An experiment doc and its trials, read once and then served from memory
+    for the rest of the request.
+    """
+
+    def __init__(self, info, trials):
+        self.info = info
+        self.trials = trials
+
+    @staticmethod
+    def fetch(experiment_id):
+        with stage("read-experiment"):
+            info, trials = storage.get_experiment(experiment_id, embedded=compiled_payloads.enabled)
+        return ExperimentSnapshot(info, trials)
+
+
 class Experiment:
-    def __init__(self,  experiment_doc_ref=None, age="Not specified", gender="Not specified", completed=False, types=[], prev_experiments=[], starts_from_trial_index=0, ends_at_trial_index=20, trials=[]):
+    def __init__(self,  experiment_id=None, age="Not specified", gender="Not specified", completed=False, types=[], prev_experiments=[], starts_from_trial_index=0, ends_at_trial_index=20, trials=[]):
         self.age = age
         self.gender = gender
         self.types = types
@@ -14,16 +35,15 @@ class Experiment:
         self.ends_at_trial_index = ends_at_trial_index
         self.starts_from_trial_index = starts_from_trial_index
         self.trials = trials
-        self.experiment_doc_ref = experiment_doc_ref
+        self.experiment_id = experiment_id
         self.completed = completed
+        self.snapshot = None
 
     def set_existing_experiment_from_id(self, experiment_id):
-        doc_ref = experiment_ref.document(experiment_id)
-        self.set_existing_experiment(doc_ref)
-
-    def set_existing_experiment(self, experiment_doc_ref):
-        self.experiment_doc_ref = experiment_doc_ref
-        self.__fetch_types()
+        self.experiment_id = experiment_id
+        types = submit(timed("types", experiment_types.get))
+        self.snapshot = ExperimentSnapshot.fetch(experiment_id)
+        self.types = types.result()
         experiment = self.get_experiment_info()
         if (experiment):
             self.age = experiment["age"]
@@ -31,28 +51,33 @@ class Experiment:
             self.completed = experiment["completed"]
             self.starts_from_trial_index = experiment["starts_from_trial_index"]
             self.ends_at_trial_index = experiment["ends_at_trial_index"]
-        # Get trials of this experiment
-        trial_docs = experiment_doc_ref.collection('trials').stream()
-        self.trials = [t.to_dict()['options'] for t in trial_docs]
-
+        self.trials = [t['options'] for t in self.snapshot.trials]
 
     def get_experiment_id(self):
-        if (self.experiment_doc_ref):
-            return self.experiment_doc_ref.id
-        else:
-            return None
+        return self.experiment_id
 
     def get_experiment_info(self):
-        experiment_doc = self.experiment_doc_ref.get()
-        if (experiment_doc.exists):
-            experiment = experiment_doc.to_dict()
-        else:
+        if (not self.snapshot):
+            self.snapshot = ExperimentSnapshot.fetch(self.experiment_id)
+        experiment = self.snapshot.info
+        if (experiment is None):
             print("Experiment doesn't exist'")
-            experiment = None
         return experiment
 
     def create_experiment(self, prolificID=None):
         self.__prepare()
+        with stage("allocate"):
+            self.__allocate_trial_slice()
+        try:
+            self.__create_from_slice(prolificID)
+        except Exception:
+            # Nothing refers to the slice yet; put it back in the queue so it
+            # isn't lost with this request
+            storage.release_slice(self.starts_from_trial_index, self.ends_at_trial_index)
+            raise
+
+    def __create_from_slice(self, prolificID):
+        self.__fetch_trials()
         new_experiment_data = {
             u'createdAt': datetime.datetime.now(),
             u'age': self.age,
@@ -62,122 +87,116 @@ class Experiment:
             u'completed': self.completed,
             u'prolificID':prolificID
         }
-        doc_ref = experiment_ref.document()
-        doc_ref.set(new_experiment_data)
-        self.experiment_doc_ref = doc_ref
-        self.__add_trials_to_db()
-        self.__add_to_inprogress(doc_ref.id)
-    
-    def get_trials(self):
-        all_trial_docs = self.experiment_doc_ref.collection("trials").get()
-        all_trials = []
-        for d in all_trial_docs:
-            tmp = d.to_dict()
-            tmp["id"] = d.id
-            all_trials.append(tmp)
-        return all_trials
-        
+        # Prefer the precompiled payload for this slice: one document instead
+        # of one per trial
+        with stage("build-trials"):
+            trials = compiled_payloads.get(
+                self.starts_from_trial_index, self.ends_at_trial_index, self.types)
+            embedded = trials is not None
+            if (not embedded):
+                trials = self.__get_full_trials()
+        with stage("write"):
+            self.experiment_id, trials = storage.create_experiment(
+                new_experiment_data, trials, embedded=embedded)
+        # Everything the handler returns was just written; no need to read it back
+        self.snapshot = ExperimentSnapshot(new_experiment_data, trials)
 
+    def get_trials(self):
+        if (not self.snapshot):
+            self.snapshot = ExperimentSnapshot.fetch(self.experiment_id)
+        return self.snapshot.trials
 
     def __get_full_trials(self):
         if (not self.trials or len(self.trials) <= 0 or len(self.types) <= 0 or not self.types):
             abort(422, "Missing trials or types")
         full_trials = []
-        print(self.trials)
-        tdf = pd.read_csv('https://firebasestorage.googleapis.com/v0/b/thelettersproject.appspot.com/o/artwork_with_hm_entropy.csv?alt=media&token=e3822a2a-8af8-433f-b840-e1edd4a1ece3')
         for type in self.types:
             for t in self.trials:
                 options_with_images=[]
-                # del t["options"]['Unnamed: 0']
-                options_dict = t
-                options_dict.pop("Unnamed: 0", None)
-                options = list(options_dict.values())
-                for o in options:
-                    current_t = tdf[tdf["id"] == o]
-                    options_with_images.append({"option_id":o, "imageURL":current_t["img"].iloc[0], "title":current_t["title"].iloc[0]})
+                for o in t:
+                    option = artwork_catalog.get_option(o)
+                    if (option is None):
+                        abort(500, "Artwork %s is missing from the catalog" % o)
+                    options_with_images.append(option)
                 full_trials.append(
                     {'name': type["name"], "best_question": type["best"], "worst_question": type["worst"], "options":options_with_images})
         return full_trials
 
     def __prepare(self):
-        self.__fetch_types()
-        self.__fetch_prev_experiments()
-        self.__fetch_trials()
-
-    def __fetch_types(self):
-        type_docs = experiment_type_ref.stream()
-        types = [t.to_dict() for t in type_docs]
-        self.types = types
+        # None of these depend on each other. All of them are resolved before
+        # a slice is allocated, so a request that fails here costs no trials.
+        # On a warm instance they are no-ops.
+        types = submit(timed("types", experiment_types.get))
+        catalog = submit(timed("catalog", artwork_catalog.ensure_loaded))
+        design = submit(timed("design", trial_design.ensure_loaded))
+        payloads = submit(timed("payloads", compiled_payloads.ensure_loaded))
+        self.types = types.result()
+        design.result()
+        catalog.result()
+        payloads.result()
+        if (not self.types):
+            abort(422, "Missing trials or types")
 
-    def __fetch_prev_experiments(self):
-        prev_experiment_docs = experiment_ref.order_by(
-            u'createdAt', direction=firestore.Query.DESCENDING).stream()
-        prev_experiments = [exp.to_dict() for exp in prev_experiment_docs]
-        self.prev_experiments = prev_experiments
-        if (len(prev_experiments) > 0):
-            last_experiment = prev_experiments[-len(prev_experiments)]
-            self.starts_from_trial_index = last_experiment['ends_at_trial_index']
-            self.ends_at_trial_index = self.starts_from_trial_index + 20
-        else:
-            last_experiment = None
-            self.starts_from_trial_index = 0
-            self.ends_at_trial_index = 20
+    def __allocate_trial_slice(self):
+        allocated = storage.allocate_slice(trial_design.row_count)
+        if (allocated):
+            self.starts_from_trial_index, self.ends_at_trial_index = allocated
+            return
+        # Out of bound
+        # hand out the slice of an unfinished experiment whose lease ran out instead
+        lease = storage.claim_lease()
+        if (not lease):
+            # No more experiments to do
+            #TODO: mark everything as complete
+            abort(404, "No more experiments")
+        self.starts_from_trial_index = lease['starts_from_trial_index']
+        self.ends_at_trial_index = lease['ends_at_trial_index']
 
     def __fetch_trials(self):
         print(self.starts_from_trial_index, self.ends_at_trial_index)
-        trials = pd.read_csv('https://firebasestorage.googleapis.com/v0/b/thelettersproject.appspot.com/o/all_trials_reduced.csv?alt=media&token=211746e2-b85c-433c-a18e-6508b257760d')
-        if (trials.shape[0]-1 <= self.ends_at_trial_index and self.starts_from_trial_index < trials.shape[0]-1):
-            # Last batch
-            # Return the remaining trials
-            self.ends_at_trial_index = trials.shape[0]-1
-        if (trials.shape[0]-1 <= self.ends_at_trial_index and self.starts_from_trial_index >= trials.shape[0]-1):
-            # Out of bound
-            # check if there are any unfinished experiments; if so, return that experiment instead
-            undone_experiments = self.__check_inprogress()
-            if (undone_experiments):
-                exp = undone_experiments[0]
-                exp_id = exp["experimentID"]
-                doc = experiment_ref.document(exp_id).get()
-                exp_info = doc.to_dict()
-                print(exp_info)
-                self.starts_from_trial_index = exp_info['starts_from_trial_index']
-                self.ends_at_trial_index = exp_info['ends_at_trial_index']
-            else:
-                # No more experiments to do
-                #TODO: mark everything as complete
-                abort(404, "No more experiments")
-        selected_trials = trials[self.starts_from_trial_index:self.ends_at_trial_index]
-        self.trials = selected_trials.to_dict('records')
-
-   
-
-    def __add_trials_to_db(self):
-        if (self.experiment_doc_ref == None):
-            abort(500, "Something went wrong while trying to add trials")
-        for t in self.__get_full_trials():
-            trial_ref = self.experiment_doc_ref.collection("trials").document()
-            trial_ref.set(t)
-
-    def __add_to_inprogress(self, experiment_id):
-        ref = db.collection("inprogress").document(experiment_id)
-        ref.set({"experimentID": experiment_id,
-                 "createdAt": datetime.datetime.now()})
-
-    def complete_experiment(self):
-        if (experiment_doc_ref):
-            # Remove from inprogress
-            db.collection("inprogress").document(
-                self.experiment_doc_ref.id).delete()
-            # Mark as completed
-            self.experiment_doc_ref.set({u'completed': True}, merge=True)
+        self.trials = trial_design.slice(self.starts_from_trial_index, self.ends_at_trial_index)
+
+    def record_responses(self, responses, complete=False):
+        """
+        Save a batch of choices, [{trialID, best, worst}, ...], in a single
+        transaction. Also refreshes this experiment's rows in the per-type
+        response log, which is what scoring and exports read. Concurrent posts
+        and retries are merged, never lost.
+        """
+        info = self.get_experiment_info()
+        if (info is None):
+            abort(404, "Experiment doesn't exist")
+        trials = {str(t['id']): t for t in self.get_trials()}
+        new_responses = {}
+        for r in responses:
+            trial = trials.get(str(r.get('trialID')))
+            if (trial is None):
+                abort(422, "Unknown trial %s" % r.get('trialID'))
+            options = [o['option_id'] if isinstance(o, dict) else o for o in trial['options']]
+            best, worst = r.get('best'), r.get('worst')
+            if (best not in options or worst not in options or best == worst):
+                abort(422, "Invalid best/worst for trial %s" % r.get('trialID'))
+            new_responses[str(r['trialID'])] = {u'best': best, u'worst': worst}
+
+        # The log entry is rewritten as a whole, so it is built from every
+        # answer stored so far, as read inside the storage transaction
+        def build_logs(answered):
+            rows = {}
+            for trial_id, answer in answered.items():
+                trial = trials[trial_id]
+                options = [o['option_id'] if isinstance(o, dict) else o for o in trial['options']]
+                rows.setdefault(trial['name'], []).append([answer['best'], answer['worst']] + options)
+            return {type: encode_response_log(r) for type, r in rows.items()}
+
+        with stage("record-responses"):
+            answered = storage.record_responses(self.experiment_id, new_responses, build_logs, complete=complete)
+        info['responses'] = answered
+        if (complete):
+            info['completed'] = True
             self.completed = True
 
-    def __check_inprogress(self):
-        docs = db.collection("inprogress").order_by(
-            u'createdAt', direction=firestore.Query.DESCENDING).stream()
-        inp = [d.to_dict() for d in docs]
-        if (len(inp) > 0):
-            # There are still some in-progress left left
-            return inp
-        else:
-            return None
\ No newline at end of file
+    def complete_experiment(self, responses=None):
+        if (self.experiment_id):
+            # Save any remaining responses, remove from inprogress and mark
+            # as completed, all in one batch
+            self.record_responses(responses or [], complete=True)
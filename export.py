@@ -0,0 +1,112 @@
+"""
+Streaming export of participants' best/worst choices, in the format
+bestworst/score_trials.py reads (best,worst,option1..optionK).
+
+Experiments are paged in id order, so the id of the last exported experiment
+is a cursor an interrupted export can resume from. Only one page is held in
+memory at a time, and the trials of a page are fetched concurrently.
+"""
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import storage, decode_response_log
+
+PAGE_SIZE = 100
+# Kept separate from the shared I/O pool so a long export can't starve /api/start
+FETCH_THREADS = 8
+
+
+def with_responses(trials, info):
+    """ Copy the answers recorded through /api/responses onto their trials """
+    responses = info.get('responses') or {}
+    if (not responses):
+        return trials
+    return [dict(t, **responses.get(str(t.get('id')), {})) for t in trials]
+
+
+def iter_experiment_trials(after=None, page_size=PAGE_SIZE):
+    """ Yields (experiment_id, trials) for every experiment after the cursor `after` """
+    with ThreadPoolExecutor(max_workers=FETCH_THREADS) as pool:
+        while True:
+            page = storage.page_experiments(after=after, limit=page_size)
+            pending = []
+            for experiment_id, info in page:
+                if ('trials' in info):
+                    pending.append((experiment_id, info, info['trials']))
+                else:
+                    pending.append((experiment_id, info, pool.submit(storage.get_trials, experiment_id)))
+            for experiment_id, info, trials in pending:
+                yield experiment_id, with_responses(trials if isinstance(trials, list) else trials.result(), info)
+            if (len(page) < page_size):
+                return
+            after = page[-1][0]
+
+
+def response_row(trial):
+    """ (type, best, worst, options) for an answered trial, or None if it wasn't answered """
+    if (trial.get('best') is None or trial.get('worst') is None):
+        return None
+    options = [o['option_id'] if isinstance(o, dict) else o for o in trial.get('options', [])]
+    return trial.get('name'), trial['best'], trial['worst'], options
+
+
+def iter_rows(type=None, after=None):
+    """ Yields (experiment_id, rows) per experiment; rows are (type, best, worst, options) """
+    for experiment_id, trials in iter_experiment_trials(after=after):
+        rows = [r for r in (response_row(t) for t in trials) if r and (type is None or r[0] == type)]
+        yield experiment_id, rows
+
+
+def iter_logged_rows(type, after=None, page_size=PAGE_SIZE):
+    """
+    Like iter_rows for one type, but read from that type's response log: one
+    small doc per experiment and no trial reads.
+    """
+    while True:
+        page = storage.page_response_log(type, after=after, limit=page_size)
+        for experiment_id, entry in page:
+            yield experiment_id, [(type, row[0], row[1], row[2:]) for row in decode_response_log(entry)]
+        if (len(page) < page_size):
+            return
+        after = page[-1][0]
+
+
+def iter_scoring_trials(type, after=None):
+    """ Trials of one experiment type as (best, worst, (unchosen, ...)), like scoring.parse_bestworst_data """
+    for _, rows in iter_logged_rows(type, after=after):
+        for _, best, worst, options in rows:
+            yield best, worst, tuple(o for o in options if o != best and o != worst)
+
+
+def stream_ndjson(type=None, after=None):
+    """
+    One JSON object per answered trial, followed by {"cursor": experiment_id}
+    once all of that experiment's trials are out. Resume with the last cursor.
+    """
+    for experiment_id, rows in iter_rows(type=type, after=after):
+        chunk = [json.dumps({"experimentID": experiment_id, "type": t, "best": b, "worst": w, "options": o})
+                 for t, b, w, o in rows]
+        chunk.append(json.dumps({"cursor": experiment_id}))
+        yield "\n".join(chunk) + "\n"
+
+
+def stream_csv(type=None, after=None):
+    """
+    experimentID,type,best,worst,option1..optionK rows, ready for
+    score_trials.py. The header is written with the first row, once K is known.
+    """
+    header_written = False
+    for experiment_id, rows in iter_rows(type=type, after=after):
+        if (not rows):
+            continue
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if (not header_written):
+            K = len(rows[0][3])
+            writer.writerow(["experimentID", "type", "best", "worst"] + ["option%d" % (i + 1) for i in range(K)])
+            header_written = True
+        for t, b, w, o in rows:
+            writer.writerow([experiment_id, t, b, w] + list(o))
+        yield out.getvalue()
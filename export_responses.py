@@ -0,0 +1,121 @@
+"""
+Exports collected best/worst choices into one csv per experiment type, ready
+for bestworst/score_trials.py:
+
+    python export_responses.py --out exports/
+    cd bestworst && python score_trials.py ../exports/<type>.csv
+
+Progress is checkpointed to <out>/export.state every --checkpoint_every
+experiments, together with the size of each csv at that point. Re-running the
+same command resumes where it stopped, trimming anything written after the
+last checkpoint, so rows are never duplicated.
+
+By default rows come from the per-type response logs written by
+/api/responses and /api/complete; --source experiments reads every
+experiment and its trials instead, which also covers answers stored on the
+trials themselves.
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import os
+import sys
+
+import export
+from storage import storage
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.cursor = None
+        self.sizes = {}
+        if (os.path.exists(path)):
+            state = json.load(open(path))
+            self.cursor = state["cursor"]
+            self.sizes = state["sizes"]
+
+    def restore(self, out):
+        """ Trim every csv back to its size at the last checkpoint """
+        for name in os.listdir(out):
+            if (name.endswith(".csv")):
+                with open(os.path.join(out, name), "a") as f:
+                    f.truncate(self.sizes.get(name, 0))
+
+    def save(self, cursor, files):
+        for f in files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self.cursor = cursor
+        self.sizes.update({name: f.tell() for name, f in files.items()})
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"cursor": cursor, "sizes": self.sizes}, f)
+        os.replace(tmp, self.path)
+
+
+def open_type_file(out, type, files, writers, K):
+    name = "%s.csv" % type
+    f = open(os.path.join(out, name), "a", newline="")
+    files[name] = f
+    writers[type] = csv.writer(f)
+    if (f.tell() == 0):
+        writers[type].writerow(["experimentID", "best", "worst"] + ["option%d" % (i + 1) for i in range(K)])
+    return writers[type]
+
+
+def iter_source(args, cursor):
+    if (args.source == "experiments"):
+        return export.iter_rows(type=args.type, after=cursor)
+    types = [args.type] if args.type else [t["name"] for t in storage.fetch_types()]
+    return iter_logs(types, cursor)
+
+
+def iter_logs(types, cursor):
+    # Merge the per-type logs by experiment id so a single cursor still marks
+    # how far every type has been exported
+    merged = heapq.merge(*[export.iter_logged_rows(type, after=cursor) for type in types], key=lambda item: item[0])
+    for experiment_id, group in itertools.groupby(merged, key=lambda item: item[0]):
+        yield experiment_id, [row for _, rows in group for row in rows]
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Export best/worst responses per experiment type.')
+    parser.add_argument("--out", type=str, default="exports", help="Folder to write <type>.csv files and the checkpoint into.")
+    parser.add_argument("--type", type=str, default=None, help="Only export this experiment type.")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and export everything again.")
+    parser.add_argument("--checkpoint_every", type=int, default=100, help="Experiments between checkpoints.")
+    parser.add_argument("--source", choices=["log", "experiments"], default="log", help="Read the response logs (fast) or every experiment's trials.")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    state_path = os.path.join(args.out, "export.state")
+    if (args.restart and os.path.exists(state_path)):
+        os.remove(state_path)
+    checkpoint = Checkpoint(state_path)
+    checkpoint.restore(args.out)
+
+    files, writers = {}, {}
+    exported = 0
+    last = None
+    try:
+        for i, (experiment_id, rows) in enumerate(iter_source(args, checkpoint.cursor)):
+            for type, best, worst, options in rows:
+                writer = writers.get(type) or open_type_file(args.out, type, files, writers, len(options))
+                writer.writerow([experiment_id, best, worst] + list(options))
+                exported += 1
+            last = experiment_id
+            if ((i + 1) % args.checkpoint_every == 0):
+                checkpoint.save(last, files)
+        if (last):
+            checkpoint.save(last, files)
+    finally:
+        for f in files.values():
+            f.close()
+    print("Exported %d trials; cursor is now %s" % (exported, checkpoint.cursor), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+from firebase_admin import firestore
+
+from concurrency import submit
+from allocator import TrialSliceAllocator, InProgressLeaseQueue
+from storage import Storage
+from metrics import count_firestore
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class FirestoreStorage(Storage):
+    def __init__(self, db):
+        self.db = db
+        self.experiment_ref = db.collection(u'experiments')
+        self.experiment_type_ref = db.collection(u'experiment_types')
+        self.allocator = TrialSliceAllocator(db)
+        self.inprogress_queue = InProgressLeaseQueue(db)
+
+    def fetch_types(self):
+        types = [t.to_dict() for t in self.experiment_type_ref.stream()]
+        count_firestore(reads=len(types))
+        return types
+
+    def watch_types(self, callback):
+        def on_snapshot(docs, changes, read_time):
+            count_firestore(reads=len(changes))
+            callback([d.to_dict() for d in docs])
+        self.experiment_type_ref.on_snapshot(on_snapshot)
+        return True
+
+    def allocate_slice(self, row_count):
+        return self.allocator.allocate(row_count)
+
+    def claim_lease(self):
+        return self.inprogress_queue.claim()
+
+    def release_slice(self, start, end):
+        self.inprogress_queue.release(start, end)
+
+    def create_experiment(self, data, trials, embedded=False):
+        doc_ref = self.experiment_ref.document()
+        lease = self.inprogress_queue.entry(
+            doc_ref.id, data['starts_from_trial_index'], data['ends_at_trial_index'])
+        if (embedded):
+            self.commit_writes([(doc_ref, dict(data, trials=trials)), lease])
+            return doc_ref.id, trials
+        trials_ref = doc_ref.collection("trials")
+        trial_writes = [(trials_ref.document(), t) for t in trials]
+        self.commit_writes([(doc_ref, data)] + trial_writes + [lease])
+        return doc_ref.id, [dict(t, id=ref.id) for ref, t in trial_writes]
+
+    def get_experiment(self, experiment_id, embedded=False):
+        """
+        Reads the experiment doc and its trials subcollection concurrently.
+        When the trials are expected inside the doc, the doc is read first and
+        the subcollection only if they turn out not to be there.
+        """
+        doc_ref = self.experiment_ref.document(experiment_id)
+        if (embedded):
+            experiment_doc = doc_ref.get()
+            info = experiment_doc.to_dict() if experiment_doc.exists else None
+            count_firestore(reads=1)
+            if (info is None or 'trials' in info):
+                return info, (info.pop('trials') if info else [])
+            trial_docs = list(doc_ref.collection("trials").stream())
+        else:
+            trials_future = submit(lambda: list(doc_ref.collection("trials").stream()))
+            experiment_doc = doc_ref.get()
+            trial_docs = trials_future.result()
+            info = experiment_doc.to_dict() if experiment_doc.exists else None
+            count_firestore(reads=1)
+        count_firestore(reads=len(trial_docs))
+        trials = []
+        for d in trial_docs:
+            tmp = d.to_dict()
+            tmp["id"] = d.id
+            trials.append(tmp)
+        return info, trials
+
+    def page_experiments(self, after=None, limit=100):
+        query = self.experiment_ref.order_by(u'__name__')
+        if (after):
+            query = query.start_after({u'__name__': self.experiment_ref.document(after)})
+        page = [(d.id, d.to_dict()) for d in query.limit(limit).stream()]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def get_trials(self, experiment_id):
+        trial_docs = list(self.experiment_ref.document(experiment_id).collection("trials").stream())
+        count_firestore(reads=max(1, len(trial_docs)))
+        trials = []
+        for d in trial_docs:
+            tmp = d.to_dict()
+            tmp["id"] = d.id
+            trials.append(tmp)
+        return trials
+
+    def response_log_ref(self, type):
+        return self.db.collection(u'response_logs').document(type).collection(u'entries')
+
+    def record_responses(self, experiment_id, responses, build_logs, complete=False):
+        transaction = self.db.transaction(max_attempts=20)
+        return _record_in_transaction(transaction, self, experiment_id, responses, build_logs, complete)
+
+    def page_response_log(self, type, after=None, limit=100):
+        entries_ref = self.response_log_ref(type)
+        query = entries_ref.order_by(u'__name__')
+        if (after):
+            query = query.start_after({u'__name__': entries_ref.document(after)})
+        page = [(d.id, d.to_dict()) for d in query.limit(limit).stream()]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def page_completed_log(self, type, since=None, after=None, limit=100):
+        entries_ref = self.response_log_ref(type)
+        query = entries_ref
+        if (since):
+            query = query.where(u'completedAt', u'>=', since)
+        query = query.order_by(u'completedAt').order_by(u'__name__')
+        if (after):
+            query = query.start_after({u'completedAt': after[0], u'__name__': entries_ref.document(after[1])})
+        query = query.limit(limit)
+        page = [(d.id, d.to_dict()) for d in query.stream()]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def commit_writes(self, writes):
+        """
+        Commit (doc_ref, data) pairs as atomic batches. Everything goes out in a
+        single commit unless it exceeds MAX_BATCH_WRITES, in which case the chunks
+        are committed in parallel.
+        """
+        batches = []
+        for i in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for ref, data in writes[i:i + MAX_BATCH_WRITES]:
+                batch.set(ref, data)
+            batches.append(batch)
+        count_firestore(writes=len(writes))
+        if (len(batches) == 1):
+            return batches[0].commit()
+        commits = [submit(b.commit) for b in batches]
+        return [c.result() for c in commits]
+
+
+@firestore.transactional
+def _record_in_transaction(transaction, storage, experiment_id, responses, build_logs, complete):
+    # Read the stored responses in the transaction, so a concurrent post or a
+    # retry makes this one retry instead of overwriting its log rows
+    doc_ref = storage.experiment_ref.document(experiment_id)
+    snapshot = doc_ref.get(transaction=transaction)
+    count_firestore(reads=1)
+    stored = snapshot.to_dict() or {}
+    answered = dict(stored.get('responses') or {}, **responses)
+    logs = build_logs(answered)
+
+    # Once completed, the log entries keep the original completion time, so
+    # responses posted later don't drop them from page_completed_log
+    completed_at = stored.get('completedAt') if stored.get('completed') else None
+    if (complete and completed_at is None):
+        completed_at = firestore.SERVER_TIMESTAMP
+
+    update = {u'responses': responses}
+    if (complete):
+        update[u'completed'] = True
+        update[u'completedAt'] = completed_at
+        transaction.delete(storage.inprogress_queue.collection_ref.document(experiment_id))
+    # merge=True merges the responses map instead of replacing it
+    transaction.set(doc_ref, update, merge=True)
+    for type, entry in logs.items():
+        if (completed_at is not None):
+            entry = dict(entry, completedAt=completed_at)
+        transaction.set(storage.response_log_ref(type).document(experiment_id), entry)
+    count_firestore(writes=1 + len(logs) + (1 if complete else 0))
+    return answered
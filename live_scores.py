@@ -0,0 +1,156 @@
+"""
+Live best/worst scores per experiment type, for watching a study converge.
+
+Each type keeps its scoring.ItemEntry state in memory and only folds in
+experiments completed since the last look, read from the response log.
+Count-based scores are updated exactly; Elo, Value and RW are continued from
+their current ratings with a few passes instead of the 100 a cold
+scoring.score_trials run does. The leaderboard is rebuilt only when new
+responses were folded in.
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "bestworst"))
+import scoring
+
+from storage import storage, decode_response_log
+from metrics import stage
+
+METHODS = ["Value", "Elo", "RW", "Best", "Worst", "Unchosen", "BestWorst", "ABW", "David"]
+# Passes over all pairings after new data lands; the ratings start from where
+# the previous fold left them, so far fewer are needed than from scratch
+WARM_PASSES = 10
+# Commit timestamps of concurrent batches can become visible out of order, so
+# every poll looks this far back and skips experiments it has already folded
+POLL_OVERLAP = datetime.timedelta(seconds=60)
+PAGE_SIZE = 100
+
+
+class TypeScores:
+    """ Scoring state of one experiment type """
+
+    def __init__(self, type, passes=WARM_PASSES):
+        self.type = type
+        self.passes = passes
+        self.items = {}
+        self.pairings = None
+        self.folded = set()
+        self.since = None
+        self.trial_count = 0
+        self.best_winner = scoring.ItemEntry(scoring.BEST_WINNER)
+        self.worst_loser = scoring.ItemEntry(scoring.WORST_LOSER)
+        # Own RNG, so request threads don't share the global one
+        self.rng = np.random.default_rng()
+        self.leaderboard = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def poll(self):
+        """ Trials of experiments completed since the last poll, as (best, worst, (unchosen, ...)) """
+        trials = []
+        since = self.since - POLL_OVERLAP if self.since else None
+        after = None
+        while True:
+            page = storage.page_completed_log(self.type, since=since, after=after, limit=PAGE_SIZE)
+            for experiment_id, entry in page:
+                if (experiment_id in self.folded):
+                    continue
+                self.folded.add(experiment_id)
+                self.since = max(self.since, entry['completedAt']) if self.since else entry['completedAt']
+                for row in decode_response_log(entry):
+                    best, worst = row[0], row[1]
+                    trials.append((best, worst, tuple(o for o in row[2:] if o != best and o != worst)))
+            # A full page may be followed by more, even if it was all
+            # experiments folded by an earlier poll
+            if (len(page) < PAGE_SIZE):
+                return trials
+            after = (page[-1][1]['completedAt'], page[-1][0])
+
+    def fold(self, trials):
+        """ Add trials to the state and bring the error-correction ratings up to date """
+        for best, worst, others in trials:
+            for item in (best, worst) + others:
+                if (item not in self.items):
+                    self.items[item] = scoring.ItemEntry(item)
+            self.items[best].best += 1
+            self.items[worst].worst += 1
+            for item in (best, worst) + others:
+                self.items[item].trials += 1
+            for item in others:
+                self.items[item].unranked += len(others) - 1
+        self.trial_count += len(trials)
+        # Only the new trials are compiled; the dummy players' pairings are
+        # kept up to date with the items
+        if (self.pairings is None):
+            self.pairings = scoring.Pairings.from_trials(trials)
+        elif (trials):
+            self.pairings = self.pairings.extended(trials)
+
+        everyone = dict(self.items)
+        everyone[scoring.BEST_WINNER] = self.best_winner
+        everyone[scoring.WORST_LOSER] = self.worst_loser
+        scoring.run_error_correction_scoring(everyone, self.pairings, iters=self.passes,
+                                             ratings=scoring.RATINGS, rng=self.rng)
+        # Exact pairing counts for the win/loss tallies and David scores
+        scoring.tally_pairings(everyone, self.pairings, 1)
+
+    def build_leaderboard(self):
+        rows = []
+        for item, entry in self.items.items():
+            row = {"item": item}
+            for method in METHODS:
+                row[method] = scoring.scoring_methods[method](entry)
+            rows.append(row)
+        rows.sort(key=lambda r: r[METHODS[0]], reverse=True)
+        return {"type": self.type, "experiments": len(self.folded), "trials": self.trial_count,
+                "methods": METHODS, "items": rows}
+
+
+class LiveScores:
+    """
+    One TypeScores per experiment type. The response log is polled at most
+    every `ttl` seconds per type; in between, and whenever nothing new was
+    completed, the cached leaderboard is returned as is.
+    """
+
+    def __init__(self, ttl=30, passes=WARM_PASSES):
+        self.ttl = ttl
+        self.passes = passes
+        self.types = {}
+        self._lock = threading.Lock()
+
+    def get(self, type):
+        with self._lock:
+            scores = self.types.get(type)
+            if (scores is None):
+                scores = self.types[type] = TypeScores(type, self.passes)
+        with scores.lock:
+            if (scores.leaderboard is None or time.time() - scores.checked_at > self.ttl):
+                self.__update(scores)
+            return scores.leaderboard
+
+    def invalidate(self, type=None):
+        """ Forget the state of one type, or of every type, so it is rebuilt from scratch """
+        with self._lock:
+            if (type is None):
+                self.types.clear()
+            else:
+                self.types.pop(type, None)
+
+    def __update(self, scores):
+        with stage("scores-poll"):
+            trials = scores.poll()
+        scores.checked_at = time.time()
+        if (trials or scores.leaderboard is None):
+            with stage("scores-fold"):
+                scores.fold(trials)
+                scores.leaderboard = scores.build_leaderboard()
+
+
+live_scores = LiveScores()
@@ -0,0 +1,150 @@
+import contextlib
+import threading
+import time
+
+from flask import g, has_request_context
+
+# Upper bounds in seconds, as in Prometheus' default buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while (i < len(self.buckets) and value > self.buckets[i]):
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Process-wide latency histograms and counters, rendered in the Prometheus
+    text format by /api/metrics. One lock guards everything; an observation
+    is a handful of additions, so contention is negligible.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if (histogram is None):
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(set(k[0] for k in self.counters)):
+                lines.append("# TYPE %s counter" % name)
+                for (n, labels), value in sorted(self.counters.items()):
+                    if (n == name):
+                        lines.append("%s%s %s" % (name, _labels(labels), value))
+            for name in sorted(set(k[0] for k in self.histograms)):
+                lines.append("# TYPE %s histogram" % name)
+                for (n, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if (n != name):
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append("%s_bucket%s %d" % (name, _labels(labels + (("le", le),)), cumulative))
+                    lines.append("%s_sum%s %f" % (name, _labels(labels), h.sum))
+                    lines.append("%s_count%s %d" % (name, _labels(labels), h.count))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if (not labels):
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, v) for k, v in labels) + "}"
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """ Stage durations and Firestore operations of one request, sent back as a Server-Timing header """
+
+    def __init__(self):
+        self.stages = []
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages.append((name, seconds))
+
+    def server_timing(self, total):
+        entries = ['%s;dur=%.1f' % (name, seconds * 1000) for name, seconds in self.stages]
+        entries.append('firestore-reads;desc="%d"' % self.reads)
+        entries.append('firestore-writes;desc="%d"' % self.writes)
+        entries.append('total;dur=%.1f' % (total * 1000))
+        return ", ".join(entries)
+
+
+def current_timings():
+    if (not has_request_context()):
+        return None
+    if ('timings' not in g):
+        g.timings = RequestTimings()
+    return g.timings
+
+
+@contextlib.contextmanager
+def stage(name, timings=None):
+    """ Time a block as workflow stage `name`, for the histogram and the current request's Server-Timing """
+    timings = timings or current_timings()
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - began
+        registry.observe("artrater_stage_seconds", {"stage": name}, elapsed)
+        if (timings):
+            timings.add(name, elapsed)
+
+
+def timed(name, fn):
+    """
+    Wrap fn so it is recorded as stage `name` of the current request even when
+    it runs on another thread (e.g. the I/O pool, where there is no request
+    context).
+    """
+    timings = current_timings()
+
+    def run(*args, **kwargs):
+        with stage(name, timings):
+            return fn(*args, **kwargs)
+    return run
+
+
+def count_firestore(reads=0, writes=0):
+    if (reads):
+        registry.inc("artrater_firestore_reads_total", {}, reads)
+    if (writes):
+        registry.inc("artrater_firestore_writes_total", {}, writes)
+    timings = current_timings()
+    if (timings):
+        with timings._lock:
+            timings.reads += reads
+            timings.writes += writes
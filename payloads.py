@@ -0,0 +1,59 @@
+import gzip
+import io
+import json
+import os
+import threading
+
+import requests
+
+
+def _same_types(a, b):
+    key = lambda t: t.get("name", "")
+    strip = lambda types: [{k: t.get(k) for k in ("name", "best", "worst")} for t in sorted(types, key=key)]
+    return strip(a) == strip(b)
+
+
+class CompiledPayloads:
+    """
+    Trial payloads precompiled per slice by bestworst/compile_payloads.py.
+
+    Enabled by pointing PAYLOADS_PATH at the compiled file (a local path or a
+    download URL). A slice is only served from the file while the experiment
+    types it was compiled with match the live ones; otherwise callers fall
+    back to building trials on the fly.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def ensure_loaded(self):
+        if (self._compiled is None and self.enabled):
+            with self._lock:
+                if (self._compiled is None):
+                    self._compiled = self.__load()
+        return self._compiled
+
+    def __load(self):
+        if (self.path.startswith("http")):
+            res = requests.get(self.path, timeout=60)
+            res.raise_for_status()
+            with gzip.open(io.BytesIO(res.content), "rt") as f:
+                return json.load(f)
+        with open(self.path, "rb") as raw, gzip.open(raw, "rt") as f:
+            return json.load(f)
+
+    def get(self, start, end, types):
+        """ The compiled trials for [start, end), or None if there are none for these types """
+        compiled = self.ensure_loaded()
+        if (not compiled or not _same_types(compiled["types"], types)):
+            return None
+        return compiled["slices"].get("%d-%d" % (start, end))
+
+
+compiled_payloads = CompiledPayloads(os.environ.get('PAYLOADS_PATH'))
@@ -0,0 +1,294 @@
+import datetime
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from metrics import count_firestore
+
+TRIALS_PER_EXPERIMENT = 20
+# How long a participant holds a slice before it may be handed to someone else
+LEASE_SECONDS = 60 * 60
+
+
+def new_lease(experiment_id, start, end, lease_seconds=LEASE_SECONDS):
+    """ The inprogress entry for an experiment holding trials [start, end) """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        u'experimentID': experiment_id,
+        u'createdAt': now,
+        u'starts_from_trial_index': start,
+        u'ends_at_trial_index': end,
+        u'leaseExpiresAt': now + datetime.timedelta(seconds=lease_seconds),
+    }
+
+
+def encode_response_log(rows):
+    """
+    Pack one experiment's answered trials of one type, each [best, worst,
+    option1..optionK], into a single flat array. Firestore doesn't allow
+    nested arrays, and one flat array is far smaller than a doc per trial.
+    """
+    width = len(rows[0]) if rows else 0
+    return {u'width': width, u'values': [v for row in rows for v in row]}
+
+
+def decode_response_log(entry):
+    width, values = entry['width'], entry['values']
+    return [values[i:i + width] for i in range(0, len(values), width)]
+
+
+class Storage:
+    """
+    Everything Experiment needs from the database. FirestoreStorage (in
+    firestore_storage.py) is what runs in production; MemoryStorage lets the
+    service run, and be load-tested, without a Firebase project.
+    """
+
+    def fetch_types(self):
+        """ All experiment types, as dicts """
+        raise NotImplementedError
+
+    def watch_types(self, callback):
+        """ Call callback(types) whenever the types change. Returns False if the backend can't push changes. """
+        return False
+
+    def allocate_slice(self, row_count):
+        """ Next free (start, end) slice of the design, or None once it is exhausted """
+        raise NotImplementedError
+
+    def claim_lease(self):
+        """ Take over the inprogress entry whose lease expired longest ago, or None if no lease has expired """
+        raise NotImplementedError
+
+    def release_slice(self, start, end):
+        """
+        Put trials [start, end) back in the inprogress queue, under an entry
+        of no experiment whose lease has already run out, so the next
+        claim_lease hands them out. For a slice whose request failed after
+        it was allocated or claimed.
+        """
+        raise NotImplementedError
+
+    def create_experiment(self, data, trials, embedded=False):
+        """
+        Write the experiment doc, its trials and its inprogress entry.
+        With embedded=True the trials (which already carry their "id") are
+        stored inside the experiment doc instead of one doc per trial.
+        Returns (experiment_id, trials with their "id").
+        """
+        raise NotImplementedError
+
+    def get_experiment(self, experiment_id, embedded=False):
+        """
+        (info, trials) for an experiment; info is None if it doesn't exist.
+        embedded=True hints that the trials are probably inside the doc.
+        """
+        raise NotImplementedError
+
+    def record_responses(self, experiment_id, responses, build_logs, complete=False):
+        """
+        In one transaction: merge `responses` ({trial id: {best, worst}}) into
+        the experiment's stored responses, replace its entry in each type's
+        response log with build_logs(all responses) ({type:
+        encode_response_log(...)}), and if `complete`, mark the experiment
+        completed and drop its inprogress entry. Log entries of a completed
+        experiment always carry its first "completedAt". Returns all responses.
+        """
+        raise NotImplementedError
+
+    def page_response_log(self, type, after=None, limit=100):
+        """ Up to `limit` (experiment_id, log entry) pairs of one type, in experiment id order """
+        raise NotImplementedError
+
+    def page_completed_log(self, type, since=None, after=None, limit=100):
+        """
+        Up to `limit` (experiment_id, log entry) pairs of one type whose
+        experiment was completed at or after `since`, in (completedAt,
+        experiment_id) order. `after` is the (completedAt, experiment_id)
+        of the last entry of the previous page. Entries carry their
+        "completedAt".
+        """
+        raise NotImplementedError
+
+    def page_experiments(self, after=None, limit=100):
+        """
+        Up to `limit` (experiment_id, info) pairs in experiment id order,
+        starting after the id `after`. Embedded trials stay in info["trials"].
+        """
+        raise NotImplementedError
+
+    def get_trials(self, experiment_id):
+        """ The trials subcollection of an experiment, each with its "id" """
+        raise NotImplementedError
+
+
+class MemoryStorage(Storage):
+    """
+    In-process stand-in for Firestore. Each method sleeps `latency` seconds
+    per round trip the Firestore implementation would make, so load tests
+    see realistic request times without touching the network.
+    """
+
+    DEFAULT_TYPES = [{"name": "example", "best": "Which artwork do you like the most?",
+                      "worst": "Which artwork do you like the least?"}]
+
+    def __init__(self, types=None, latency=0.0, size=TRIALS_PER_EXPERIMENT):
+        self.types = types or self.DEFAULT_TYPES
+        self.latency = latency
+        self.size = size
+        self.experiments = {}
+        self.trials = {}
+        self.inprogress = {}
+        self.response_logs = {}
+        self.next_trial_index = 0
+        self._lock = threading.Lock()
+        self._trial_ids = itertools.count()
+
+    def _round_trips(self, n=1):
+        if (self.latency):
+            time.sleep(self.latency * n)
+
+    def fetch_types(self):
+        self._round_trips()
+        count_firestore(reads=len(self.types))
+        return [dict(t) for t in self.types]
+
+    def allocate_slice(self, row_count):
+        # Transaction: read the counter, then commit
+        self._round_trips(2)
+        count_firestore(reads=1, writes=1)
+        with self._lock:
+            start = self.next_trial_index
+            if (start >= row_count - 1):
+                return None
+            end = min(start + self.size, row_count - 1)
+            self.next_trial_index = end
+            return start, end
+
+    def claim_lease(self):
+        self._round_trips(2)
+        count_firestore(reads=1, writes=1)
+        with self._lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            expired = [k for k, v in self.inprogress.items() if v['leaseExpiresAt'] <= now]
+            if (not expired):
+                return None
+            experiment_id = min(expired, key=lambda k: self.inprogress[k]['leaseExpiresAt'])
+            return self.inprogress.pop(experiment_id)
+
+    def release_slice(self, start, end):
+        self._round_trips()
+        count_firestore(writes=1)
+        lease_id = uuid.uuid4().hex
+        with self._lock:
+            self.inprogress[lease_id] = new_lease(lease_id, start, end, lease_seconds=0)
+
+    def create_experiment(self, data, trials, embedded=False):
+        self._round_trips()
+        experiment_id = uuid.uuid4().hex
+        if (not embedded):
+            trials = [dict(t, id=str(next(self._trial_ids))) for t in trials]
+        count_firestore(writes=2 + (0 if embedded else len(trials)))
+        with self._lock:
+            self.experiments[experiment_id] = dict(data)
+            self.trials[experiment_id] = trials
+            self.inprogress[experiment_id] = new_lease(
+                experiment_id, data['starts_from_trial_index'], data['ends_at_trial_index'])
+        return experiment_id, trials
+
+    def get_experiment(self, experiment_id, embedded=False):
+        self._round_trips()
+        info = self.experiments.get(experiment_id)
+        trials = list(self.trials.get(experiment_id, []))
+        count_firestore(reads=1 if embedded else 1 + len(trials))
+        return (dict(info) if info else None), trials
+
+    def record_responses(self, experiment_id, responses, build_logs, complete=False):
+        self._round_trips(2)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            experiment = self.experiments.setdefault(experiment_id, {})
+            answered = experiment.setdefault('responses', {})
+            answered.update(responses)
+            logs = build_logs(answered)
+            count_firestore(reads=1, writes=1 + len(logs) + (1 if complete else 0))
+            completed_at = experiment.get('completedAt') if experiment.get('completed') else None
+            if (complete and completed_at is None):
+                completed_at = now
+            for type, entry in logs.items():
+                if (completed_at is not None):
+                    entry = dict(entry, completedAt=completed_at)
+                self.response_logs.setdefault(type, {})[experiment_id] = entry
+            if (complete):
+                experiment['completed'] = True
+                experiment['completedAt'] = completed_at
+                self.inprogress.pop(experiment_id, None)
+            return dict(answered)
+
+    def page_response_log(self, type, after=None, limit=100):
+        self._round_trips()
+        with self._lock:
+            log = self.response_logs.get(type, {})
+            ids = sorted(k for k in log if after is None or k > after)[:limit]
+            page = [(k, log[k]) for k in ids]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def page_completed_log(self, type, since=None, after=None, limit=100):
+        self._round_trips()
+        with self._lock:
+            log = self.response_logs.get(type, {})
+            page = sorted(((k, e) for k, e in log.items()
+                           if 'completedAt' in e and (since is None or e['completedAt'] >= since)
+                           and (after is None or (e['completedAt'], k) > after)),
+                          key=lambda kv: (kv[1]['completedAt'], kv[0]))[:limit]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def page_experiments(self, after=None, limit=100):
+        self._round_trips()
+        with self._lock:
+            ids = sorted(k for k in self.experiments if after is None or k > after)[:limit]
+            page = [(k, dict(self.experiments[k])) for k in ids]
+        count_firestore(reads=max(1, len(page)))
+        return page
+
+    def get_trials(self, experiment_id):
+        self._round_trips()
+        trials = list(self.trials.get(experiment_id, []))
+        count_firestore(reads=max(1, len(trials)))
+        return trials
+
+
+def create_storage():
+    """
+    ARTRATER_STORAGE=memory selects MemoryStorage, with ARTRATER_STORAGE_LATENCY_MS
+    of simulated latency per round trip. Anything else means Firestore.
+    """
+    if (os.environ.get('ARTRATER_STORAGE') == 'memory'):
+        latency = float(os.environ.get('ARTRATER_STORAGE_LATENCY_MS', 0)) / 1000
+        return MemoryStorage(latency=latency)
+    from admin import get_db
+    from firestore_storage import FirestoreStorage
+    return FirestoreStorage(get_db())
+
+
+class LazyStorage:
+    """ Stands in for the configured backend and only creates it on first use, keeping imports cheap """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if (self._backend is None):
+            with self._lock:
+                if (self._backend is None):
+                    self._backend = self._factory()
+        return getattr(self._backend, name)
+
+
+storage = LazyStorage(create_storage)
@@ -0,0 +1,53 @@
+"""
+The backend runs on MemoryStorage in these tests, with the synthetic artwork
+catalog and trial design of benchmarks/load_test.py, so no Firebase project
+or network is needed.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import load_test
+
+ARTWORKS = 30
+DESIGN_ROWS = 200
+
+os.environ["ARTRATER_STORAGE"] = "memory"
+os.environ["ARTRATER_PREWARM"] = "0"
+os.environ["ADMIN_TOKEN"] = "test"
+os.environ["ARTWORK_CSV_PATH"], os.environ["TRIAL_DESIGN_PATH"] = load_test.write_fixtures(
+    tempfile.mkdtemp(), ARTWORKS, DESIGN_ROWS)
+
+
+@pytest.fixture
+def backend():
+    """ A fresh MemoryStorage behind the shared storage proxy """
+    from storage import storage, MemoryStorage
+    storage._backend = MemoryStorage()
+    yield storage._backend
+    storage._backend = None
+
+
+@pytest.fixture
+def client(backend):
+    from app import app
+    return app.test_client()
+
+
+def start(client):
+    """ POST /api/start; returns (experiment id, trials) """
+    res = client.post("/api/start", json={"prolificID": "p"})
+    assert res.status_code == 200
+    data = res.get_json()
+    return data["experimentID"], data["trials"]
+
+
+def answers(trials):
+    """ A response per trial, picking its first option as best and second as worst """
+    return [{"trialID": t["id"], "best": t["options"][0]["option_id"], "worst": t["options"][1]["option_id"]}
+            for t in trials]
@@ -0,0 +1,49 @@
+"""
+/api/start on MemoryStorage: handing out design slices, and not losing them
+when a request fails.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import DESIGN_ROWS, start
+from catalog import artwork_catalog, _key
+from types_cache import experiment_types
+
+
+def slices(backend):
+    return sorted((e["starts_from_trial_index"], e["ends_at_trial_index"]) for e in backend.experiments.values())
+
+
+def test_concurrent_starts_get_consecutive_slices(client, backend):
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: start(client), range(6)))
+
+    assert slices(backend) == [(i, i + 20) for i in range(0, 120, 20)]
+    assert len(backend.inprogress) == 6
+
+
+def test_failure_before_allocating_costs_no_trials(client, backend, monkeypatch):
+    monkeypatch.setattr(experiment_types, "get", lambda: [])
+    assert client.post("/api/start", json={"prolificID": "p"}).status_code == 422
+
+    assert backend.next_trial_index == 0
+    assert not backend.inprogress
+
+
+def test_failure_after_allocating_puts_the_slice_back(client, backend, monkeypatch):
+    artwork_catalog.ensure_loaded()
+    monkeypatch.delitem(artwork_catalog._index, _key(0))
+    assert client.post("/api/start", json={"prolificID": "p"}).status_code == 500
+    assert not backend.experiments
+    assert [(e["starts_from_trial_index"], e["ends_at_trial_index"]) for e in backend.inprogress.values()] == [(0, 20)]
+    monkeypatch.undo()
+
+    # fresh slices come first; once the design is used up, the released one
+    # is handed out before any lease that is still held
+    start(client)
+    assert slices(backend) == [(20, 40)]
+    backend.next_trial_index = DESIGN_ROWS - 1
+    start(client)
+    assert slices(backend) == [(0, 20), (20, 40)]
+    assert len(backend.inprogress) == 2
@@ -0,0 +1,43 @@
+"""
+The numpy engine against the sequential python engine, on a design large
+enough that the dummy players are in far more pairings than any chunk size
+would hold: 3000 items, 15000 trials.
+"""
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bestworst"))
+import scoring
+
+METHODS = ["Value", "Elo", "RW"]
+
+
+def simulate(num_items, num_trials, K=4, noise=0.5, seed=1):
+    rng = random.Random(seed)
+    items = [str(i) for i in range(num_items)]
+    latent = dict((item, rng.gauss(0, 1)) for item in items)
+    trials = []
+    for _ in range(num_trials):
+        ranked = sorted(rng.sample(items, K), key=lambda item: latent[item] + rng.gauss(0, noise), reverse=True)
+        trials.append((ranked[0], ranked[-1], tuple(ranked[1:-1])))
+    return items, trials
+
+
+def spearman(a, b):
+    return np.corrcoef(np.argsort(np.argsort(a)), np.argsort(np.argsort(b)))[0, 1]
+
+
+def test_numpy_engine_matches_python_on_a_large_design():
+    items, trials = simulate(3000, 15000)
+    python = scoring.score_trials(trials, METHODS, iters=20, engine="python", rng=1)
+    numpy = scoring.score_trials(trials, METHODS, iters=20, engine="numpy", rng=1)
+
+    values = [numpy[item].value for item in items]
+    assert 0 < min(values) and max(values) < 1
+    assert 0 < numpy[scoring.WORST_LOSER].value < numpy[scoring.BEST_WINNER].value < 1
+    for method in METHODS:
+        score = scoring.scoring_methods[method]
+        assert spearman([score(python[i]) for i in items], [score(numpy[i]) for i in items]) > 0.99, method
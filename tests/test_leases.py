@@ -0,0 +1,44 @@
+"""
+The inprogress lease queue on MemoryStorage, used once the design is used up.
+"""
+import datetime
+
+from conftest import DESIGN_ROWS, start
+from catalog import artwork_catalog, _key
+
+
+def expire(backend, experiment_id):
+    backend.inprogress[experiment_id]["leaseExpiresAt"] = datetime.datetime.now(datetime.timezone.utc)
+
+
+def test_only_expired_leases_are_claimed(client, backend):
+    first, _ = start(client)
+    second, _ = start(client)
+    backend.next_trial_index = DESIGN_ROWS - 1
+    assert client.post("/api/start", json={"prolificID": "p"}).status_code == 404
+
+    expire(backend, second)
+    eid, _ = start(client)
+    info = backend.experiments[eid]
+    assert (info["starts_from_trial_index"], info["ends_at_trial_index"]) == (20, 40)
+    assert set(backend.inprogress) == {first, eid}
+    assert backend.inprogress[eid]["leaseExpiresAt"] > datetime.datetime.now(datetime.timezone.utc)
+
+
+def test_a_failed_claim_puts_the_slice_back(client, backend, monkeypatch):
+    held, _ = start(client)
+    backend.next_trial_index = DESIGN_ROWS - 1
+    expire(backend, held)
+
+    artwork_catalog.ensure_loaded()
+    monkeypatch.delitem(artwork_catalog._index, _key(0))
+    assert client.post("/api/start", json={"prolificID": "p"}).status_code == 500
+    monkeypatch.undo()
+    [(lease_id, lease)] = backend.inprogress.items()
+    assert lease_id != held
+    assert (lease["starts_from_trial_index"], lease["ends_at_trial_index"]) == (0, 20)
+
+    eid, _ = start(client)
+    info = backend.experiments[eid]
+    assert (info["starts_from_trial_index"], info["ends_at_trial_index"]) == (0, 20)
+    assert set(backend.inprogress) == {eid}
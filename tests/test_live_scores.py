@@ -0,0 +1,63 @@
+"""
+The live leaderboard on MemoryStorage, polling the response log across pages.
+"""
+import datetime
+import random
+
+from live_scores import LiveScores, PAGE_SIZE
+from storage import encode_response_log
+import scoring
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def complete(backend, count, first=0, at=None, rng=random.Random(1)):
+    """ Log entries for `count` completed experiments, 0.1 s apart unless they all complete `at` once """
+    trials = []
+    for i in range(first, first + count):
+        rows = []
+        for _ in range(5):
+            options = rng.sample(range(30), 4)
+            rows.append([options[0], options[-1]] + options)
+            trials.append((options[0], options[-1], tuple(options[1:-1])))
+        completed_at = at or NOW + datetime.timedelta(seconds=0.1 * i)
+        backend.response_logs.setdefault("example", {})["e%04d" % i] = dict(
+            encode_response_log(rows), completedAt=completed_at)
+    return trials
+
+
+def test_polling_continues_past_a_page_of_folded_experiments(backend):
+    trials = complete(backend, PAGE_SIZE + 50)
+    scores = LiveScores(ttl=0)
+    board = scores.get("example")
+    assert board["experiments"] == PAGE_SIZE + 50
+
+    trials += complete(backend, 10, first=PAGE_SIZE + 50)
+    board = scores.get("example")
+    assert board["experiments"] == PAGE_SIZE + 60
+    assert board["trials"] == len(trials)
+
+    # counts are exact, whatever order the trials were folded in
+    cold = scoring.score_trials(trials, ["Best", "Worst"])
+    for row in board["items"]:
+        assert (row["Best"], row["Worst"]) == (cold[row["item"]].best, cold[row["item"]].worst)
+
+
+def test_pages_of_simultaneous_completions(backend):
+    complete(backend, PAGE_SIZE * 2 + 5, at=NOW)
+    scores = LiveScores(ttl=0)
+    assert scores.get("example")["experiments"] == PAGE_SIZE * 2 + 5
+
+    complete(backend, 3, first=PAGE_SIZE * 2 + 5, at=NOW)
+    assert scores.get("example")["experiments"] == PAGE_SIZE * 2 + 8
+
+
+def test_ratings_stay_bounded(backend):
+    complete(backend, 40)
+    scores = LiveScores(ttl=0)
+    scores.get("example")
+    complete(backend, 40, first=40)
+    board = scores.get("example")
+    values = [row["Value"] for row in board["items"]]
+    assert 0 < min(values) and max(values) < 1
+    assert board["items"][0]["Value"] >= board["items"][-1]["Value"]
@@ -0,0 +1,78 @@
+"""
+The fitted models converge, to finite scores in the right order, on designs
+where undamped Newton steps overshoot: a bipartite design, two items, and
+small dense designs.
+"""
+import os
+import random
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bestworst"))
+import mle_scoring
+import scoring
+from test_array_scoring import spearman
+
+
+def simulate(items, num_trials, K, pairs=None, seed=1):
+    rng = random.Random(seed)
+    latent = dict((item, rng.gauss(0, 1)) for item in items)
+    trials = []
+    for _ in range(num_trials):
+        options = list(rng.choice(pairs)) if pairs else rng.sample(items, K)
+        ranked = sorted(options, key=lambda item: latent[item] + rng.gauss(0, 1), reverse=True)
+        trials.append((ranked[0], ranked[-1], tuple(ranked[1:-1])))
+    return latent, trials
+
+
+def fit(trials):
+    pairings = scoring.Pairings.from_trials(trials)
+    real = pairings.real
+    keep = (pairings.winners < real) & (pairings.losers < real)
+    matrix = scoring.WinMatrix.from_pairings(pairings.winners[keep], pairings.losers[keep], real)
+    bt_report, maxdiff_report = {}, {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        bt = mle_scoring.fit_bradley_terry(matrix, report=bt_report)
+        maxdiff = mle_scoring.fit_maxdiff(pairings.trial_rows, real, report=maxdiff_report)
+    return pairings.items[:real], [(bt, bt_report), (maxdiff, maxdiff_report)]
+
+
+A = ["a%d" % i for i in range(10)]
+B = ["b%d" % i for i in range(10)]
+DESIGNS = {
+    # every a only ever meets a b
+    "bipartite" : dict(items=A + B, num_trials=5000, K=2, pairs=[(a, b) for a in A for b in B]),
+    "2 items"   : dict(items=["x", "y"], num_trials=50, K=2),
+    "3 items/K3": dict(items=list("pqr"), num_trials=300, K=3),
+    "5 items/K2": dict(items=list("abcde"), num_trials=300, K=2),
+    "5 items/K4": dict(items=list("abcde"), num_trials=300, K=4),
+}
+
+
+@pytest.mark.parametrize("name", sorted(DESIGNS))
+def test_fits_converge_on_small_and_bipartite_designs(name):
+    latent, trials = simulate(**DESIGNS[name])
+    items, fits = fit(trials)
+    truth = [latent[item] for item in items]
+    for scores, report in fits:
+        assert report["converged"] is True
+        assert report["iterations"] < 50
+        assert np.all(np.isfinite(scores))
+        assert abs(scores.mean()) < 1e-9
+        if len(items) > 2:
+            assert spearman(scores, truth) > 0.8
+        else:
+            assert np.argmax(scores) == np.argmax(truth)
+
+
+def test_running_out_of_iterations_is_reported():
+    latent, trials = simulate(**DESIGNS["bipartite"])
+    pairings = scoring.Pairings.from_trials(trials)
+    report = {}
+    with pytest.warns(UserWarning, match="did not converge"):
+        mle_scoring.fit_maxdiff(pairings.trial_rows, pairings.real, max_iters=2, report=report)
+    assert report == {"iterations": 2, "converged": False}
@@ -0,0 +1,88 @@
+"""
+/api/responses and /api/complete on MemoryStorage: merging batches into the
+stored responses and the response log, and rejecting malformed bodies.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import start, answers
+from storage import decode_response_log
+
+
+def logged_rows(backend, experiment_id):
+    return sum(len(decode_response_log(log[experiment_id]))
+               for log in backend.response_logs.values() if experiment_id in log)
+
+
+def test_batches_are_merged(client, backend):
+    eid, trials = start(client)
+    given = answers(trials)
+    for i in range(0, len(given), 3):
+        res = client.post("/api/responses", json={"experimentID": eid, "responses": given[i:i + 3]})
+        assert res.status_code == 200
+
+    assert len(backend.experiments[eid]["responses"]) == len(given)
+    assert logged_rows(backend, eid) == len(given)
+
+
+def test_concurrent_posts_keep_every_response(client, backend):
+    eid, trials = start(client)
+    given = answers(trials)
+    post = lambda r: client.post("/api/responses", json={"experimentID": eid, "responses": [r]}).status_code
+    with ThreadPoolExecutor(8) as pool:
+        assert set(pool.map(post, given)) == {200}
+
+    assert logged_rows(backend, eid) == len(given)
+
+
+def test_complete_marks_the_experiment_and_frees_its_lease(client, backend):
+    eid, trials = start(client)
+    assert eid in backend.inprogress
+    res = client.post("/api/complete", json={"experimentID": eid, "responses": answers(trials)})
+
+    assert res.status_code == 200
+    assert backend.experiments[eid]["completed"]
+    assert eid not in backend.inprogress
+    assert [k for k, _ in backend.page_completed_log("example")] == [eid]
+
+
+def test_responses_after_completion_keep_the_completion_time(client, backend):
+    eid, trials = start(client)
+    given = answers(trials)
+    client.post("/api/complete", json={"experimentID": eid, "responses": given[:5]})
+    completed_at = backend.experiments[eid]["completedAt"]
+
+    res = client.post("/api/responses", json={"experimentID": eid, "responses": given[5:]})
+    assert res.status_code == 200
+    page = backend.page_completed_log("example")
+    assert [k for k, _ in page] == [eid]
+    assert page[0][1]["completedAt"] == completed_at
+    assert len(decode_response_log(page[0][1])) == len(given)
+
+    # completing again doesn't move it either
+    client.post("/api/complete", json={"experimentID": eid, "responses": []})
+    assert backend.experiments[eid]["completedAt"] == completed_at
+
+
+@pytest.mark.parametrize("body", [
+    [1, 2],
+    "responses",
+    {"experimentID": "EID", "responses": "nope"},
+    {"experimentID": "EID", "responses": [None]},
+    {"experimentID": "EID", "responses": ["x"]},
+    {"experimentID": "EID", "responses": [{"trialID": "0", "best": "1"}]},
+])
+def test_malformed_bodies_are_rejected(client, backend, body):
+    eid, _ = start(client)
+    if (isinstance(body, dict)):
+        body = dict(body, experimentID=eid)
+    for path in ("/api/responses", "/api/complete"):
+        assert client.post(path, json=body).status_code == 400
+
+
+def test_unknown_trials_are_rejected(client, backend):
+    eid, trials = start(client)
+    res = client.post("/api/responses", json={"experimentID": eid,
+                                              "responses": [{"trialID": "nope", "best": 1, "worst": 2}]})
+    assert res.status_code == 422
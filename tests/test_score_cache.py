@@ -0,0 +1,39 @@
+"""
+Continuing from a cached prefix of the trials must not stand in for
+scoring them from scratch.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bestworst"))
+import score_cache
+import scoring
+from test_array_scoring import simulate
+
+
+def test_warm_started_results_are_not_cached_as_cold_ones(tmp_path):
+    items, trials = simulate(50, 500)
+    cache = score_cache.ScoreCache(str(tmp_path))
+    cache.score_trials(trials[:400], ["Value"], seed=1)
+
+    report = {}
+    cache.score_trials(trials, ["Value"], seed=1, report=report)
+    assert report["iterations"] == scoring.WARM_PASSES
+    settings = score_cache.settings_key(["Value"], 100, True, "python", None, 1)
+    assert not os.path.exists(cache.path(settings, len(trials), score_cache.trials_key(trials)))
+
+    # the same warm run is a lookup
+    report = {}
+    cache.score_trials(trials, ["Value"], seed=1, report=report)
+    assert report["iterations"] == scoring.WARM_PASSES
+
+    # and a run from scratch, once cached, is preferred over it
+    cold = scoring.score_trials(trials, ["Value"], rng=1)
+    fresh = score_cache.ScoreCache(str(tmp_path / "fresh"))
+    fresh.score_trials(trials, ["Value"], seed=1)
+    for name in os.listdir(fresh.directory):
+        os.rename(os.path.join(fresh.directory, name), os.path.join(cache.directory, name))
+    report = {}
+    results = cache.score_trials(trials, ["Value"], seed=1, report=report)
+    assert report["iterations"] == 100
+    assert all(results[item].value == cold[item].value for item in items)
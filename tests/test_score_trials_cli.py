@@ -0,0 +1,67 @@
+"""
+score_trials.py run as a script, on a small generated response file.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bestworst"))
+import score_trials
+
+HEADER = ["Word", "Value", "Elo", "RW", "Best", "Worst", "Unchosen", "BestWorst", "ABW", "David", "ValueLogit",
+          "RWLogit", "BestWorstLogit"]
+
+
+def write_responses(path, num_items=40, num_trials=400, K=4, seed=1):
+    rng = random.Random(seed)
+    items = ["w%d" % i for i in range(num_items)]
+    latent = dict((item, rng.gauss(0, 1)) for item in items)
+    with open(path, "w") as f:
+        f.write(",".join(["best", "worst"] + ["option%d" % (i+1) for i in range(K)]) + "\n")
+        for _ in range(num_trials):
+            options = rng.sample(items, K)
+            ranked = sorted(options, key=lambda item: latent[item] + rng.gauss(0, 0.5), reverse=True)
+            f.write(",".join([ranked[0], ranked[-1]] + options) + "\n")
+    return items
+
+
+def run(capsys, *argv):
+    score_trials.main(list(argv))
+    out, err = capsys.readouterr()
+    return out.splitlines(), err
+
+
+def test_prints_a_row_of_scores_per_item(tmp_path, capsys):
+    path = str(tmp_path / "responses.csv")
+    items = write_responses(path)
+    lines, _ = run(capsys, path, "--iters", "5", "--seed", "1")
+
+    assert lines[0].split(",") == HEADER
+    rows = [line.split(",") for line in lines[1:]]
+    assert sorted(row[0] for row in rows) == sorted(items)
+    for row in rows:
+        assert len(row) == len(HEADER)
+        [float(score) for score in row[1:]]
+
+
+def test_tol_reports_convergence(tmp_path, capsys):
+    path = str(tmp_path / "responses.csv")
+    write_responses(path)
+    lines, err = run(capsys, path, "--tol", "0.001", "--seed", "1")
+
+    assert len(lines) == 41
+    assert err.startswith("iterations: ")
+    assert "converged at: " in err
+
+
+def test_cached_scores_match_a_fresh_run(tmp_path, capsys):
+    path = str(tmp_path / "responses.csv")
+    write_responses(path)
+    cache = str(tmp_path / "cache")
+    fresh, _ = run(capsys, path, "--iters", "5", "--seed", "1")
+    first, _ = run(capsys, path, "--iters", "5", "--seed", "1", "--cache", cache)
+    second, _ = run(capsys, path, "--iters", "5", "--seed", "1", "--cache", cache)
+
+    assert os.listdir(cache)
+    assert sorted(first) == sorted(fresh)
+    assert sorted(second) == sorted(first)
@@ -0,0 +1,71 @@
+import io
+import os
+import threading
+
+import numpy as np
+import requests
+
+TRIALS_CSV_URL = 'https://firebasestorage.googleapis.com/v0/b/thelettersproject.appspot.com/o/all_trials_reduced.csv?alt=media&token=211746e2-b85c-433c-a18e-6508b257760d'
+
+
+def design_to_matrix(tdf):
+    """
+    Turn the DataFrame written by bestworst/create_trials.py into a rows x K
+    matrix of option ids. Numeric ids are packed into int32; anything else is
+    kept as an object array.
+    """
+    tdf = tdf.drop(columns=[c for c in tdf.columns if str(c).startswith("Unnamed")])
+    try:
+        return tdf.to_numpy(dtype=np.int32)
+    except (TypeError, ValueError):
+        return tdf.to_numpy(dtype=object)
+
+
+class TrialDesignStore:
+    """
+    The full best-worst design, loaded once per process.
+
+    By default the csv is downloaded from Firebase Storage. Setting
+    TRIAL_DESIGN_PATH to the .npy file written by create_trials.py memory-maps
+    it instead, so nothing is parsed at all; a local .csv also works.
+    """
+
+    def __init__(self, url=TRIALS_CSV_URL, path=None):
+        self.url = url
+        self.path = path
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self):
+        if (self._matrix is None):
+            with self._lock:
+                if (self._matrix is None):
+                    self._matrix = self.__load()
+        return self._matrix
+
+    def __load(self):
+        # Only csv designs, local or downloaded, need pandas; a memory-mapped
+        # .npy design loads without ever importing it
+        if (self.path and self.path.endswith(".csv")):
+            import pandas as pd
+            return design_to_matrix(pd.read_csv(self.path))
+        if (self.path):
+            return np.load(self.path, mmap_mode='r', allow_pickle=False)
+        import pandas as pd
+        res = requests.get(self.url, timeout=30)
+        res.raise_for_status()
+        return design_to_matrix(pd.read_csv(io.StringIO(res.text)))
+
+    @property
+    def row_count(self):
+        return self.ensure_loaded().shape[0]
+
+    def __len__(self):
+        return self.row_count
+
+    def slice(self, start, end):
+        """ Returns trials [start, end) as lists of option ids (plain python values) """
+        return self.ensure_loaded()[start:end].tolist()
+
+
+trial_design = TrialDesignStore(path=os.environ.get('TRIAL_DESIGN_PATH'))
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from storage import storage
+
+
+class ExperimentTypesCache:
+    """
+    In-memory copy of the experiment_types collection.
+
+    A snapshot listener keeps it current when the storage backend supports
+    one. Without a listener, entries older than `ttl` seconds are reloaded in
+    the background while callers keep getting the previous copy. Only the
+    very first load blocks.
+    """
+
+    def __init__(self, storage, ttl=300):
+        self.storage = storage
+        self.ttl = ttl
+        self.loaded_at = None
+        self._types = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._watching = False
+
+    def start(self):
+        """ Load now and subscribe to changes. Happens on the first get(). """
+        self.load()
+        try:
+            self._watching = self.storage.watch_types(self.__on_change)
+        except Exception as e:
+            print("Falling back to TTL refresh for experiment types:", e)
+
+    def get(self):
+        if (self._types is None):
+            with self._lock:
+                if (self._types is None):
+                    self.start()
+        elif (not self._watching and time.time() - self.loaded_at > self.ttl):
+            self.__refresh_in_background()
+        return self._types
+
+    def load(self):
+        self._types = self.storage.fetch_types()
+        self.loaded_at = time.time()
+        return self._types
+
+    def invalidate(self):
+        """ Drop the cached copy and reload it right away """
+        with self._lock:
+            return self.load()
+
+    def __on_change(self, types):
+        self._types = types
+        self.loaded_at = time.time()
+
+    def __refresh_in_background(self):
+        with self._lock:
+            if (self._refreshing):
+                return
+            self._refreshing = True
+        threading.Thread(target=self.__refresh, daemon=True).start()
+
+    def __refresh(self):
+        try:
+            self.load()
+        except Exception as e:
+            print("Experiment types refresh failed:", e)
+        finally:
+            self._refreshing = False
+
+
+experiment_types = ExperimentTypesCache(storage)